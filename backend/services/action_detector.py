@@ -1,17 +1,187 @@
 import os
+import bisect
+import heapq
+import math
+import multiprocessing
+import time
 import cv2
-from moviepy.editor import VideoFileClip
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from google.cloud import vision
 import numpy as np
+from media_source import MediaSource
+from response_cache import ResponseCache
+from telemetry import get_telemetry
+from motion_filter import MotionScorer, motion_pass, select_active_windows
+from vad import speech_mask
+
+# batch_annotate_images accepts at most 16 images per call
+MAX_VISION_BATCH = 16
+
+# Response cache identity of a Vision score; bump the version if _score_annotation changes
+VISION_CACHE_MODEL = "vision:OBJECT_LOCALIZATION,FACE_DETECTION"
+VISION_CACHE_PROMPT = "activity-score-v1"
+
+
+def encode_frames(frames, fps, max_side=None):
+    """
+    Yields (timestamp, jpeg_bytes) for each decoded frame, shrunk first so
+    its longer side is at most max_side pixels
+    """
+    for frame_num, frame in frames:
+        timestamp = frame_num / fps
+        frame = shrink_frame(frame, max_side)
+
+        # Encode frame for Vision API
+        success, buffer = cv2.imencode('.jpg', frame)
+        if not success:
+            get_telemetry().event("frame_encode_failed", level="error", timestamp=round(timestamp, 2))
+            continue
+        yield timestamp, buffer.tobytes()
+
+
+def shrink_frame(frame, max_side):
+    """Downscales a frame so its longer side is at most max_side pixels."""
+    height, width = frame.shape[:2]
+    if not max_side or max(height, width) <= max_side:
+        return frame
+    scale = max_side / max(height, width)
+    size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+
+def upload_frame_size(source, max_side):
+    """
+    Returns the (width, height) whose longer side is max_side for decoding
+    frames to upload, or None when the video is no larger than that.
+    """
+    if not max_side or max(source.width, source.height) <= max_side:
+        return None
+    if source.width >= source.height:
+        return source.scaled_size(width=max_side)
+    return source.scaled_size(height=max_side)
+
+
+def select_top_moments(moments, k, window=25):
+    """
+    Ranks (timestamp, score) moments with a heap and keeps the k best whose
+    window-second trim windows do not overlap (non-maximum suppression).
+    Returns them highest score first; ties go to the earlier moment.
+    """
+    heap = [(-score, timestamp) for timestamp, score in moments]
+    heapq.heapify(heap)
+    chosen = []
+    while heap and len(chosen) < k:
+        negative_score, timestamp = heapq.heappop(heap)
+        # Windows centered less than a window apart would overlap
+        if all(abs(timestamp - kept) >= window for kept, _ in chosen):
+            chosen.append((timestamp, -negative_score))
+    return chosen
+
+
+def shard_targets(frame_numbers, shards):
+    """Returns the frame numbers plan_shards tries to split ascending frame_numbers at."""
+    if not frame_numbers:
+        return []
+    first, last = frame_numbers[0], frame_numbers[-1]
+    return [first + (last - first + 1) * i / shards for i in range(1, shards)]
+
+
+def plan_shards(frame_numbers, keyframes, shards):
+    """
+    Splits ascending sample frame numbers into at most shards contiguous groups
+    whose boundaries fall on keyframes, so each group decodes from its own
+    keyframe without touching the others. Returns (group, previous) pairs,
+    where previous is the last sample before the group (None for the first).
+    """
+    frame_numbers = list(frame_numbers)
+    if not frame_numbers:
+        return []
+    first = frame_numbers[0]
+
+    boundaries = []
+    for target in shard_targets(frame_numbers, shards):
+        index = bisect.bisect_left(keyframes, target)
+        if index < len(keyframes) and keyframes[index] > (boundaries[-1] if boundaries else first):
+            boundaries.append(keyframes[index])
+
+    groups = []
+    previous = None
+    start = 0
+    for boundary in boundaries + [float("inf")]:
+        end = bisect.bisect_left(frame_numbers, boundary, start)
+        if end > start:
+            groups.append((frame_numbers[start:end], previous))
+            previous = frame_numbers[end - 1]
+            start = end
+    return groups
+
+
+def _scan_shard(video_path, frame_numbers, previous, mode, motion_width, upload_size=None):
+    """
+    Worker process entry point: decodes one shard with its own decoder.
+    mode="encode" returns [(timestamp, jpeg_bytes)]; mode="motion" returns
+    (frame_numbers, energies), with the first energy measured against the
+    previous sample so shard edges score exactly as in one pass. previous
+    itself belongs to the shard before and is never returned.
+    """
+    targets = ([previous] if previous is not None else []) + list(frame_numbers)
+    # Samples are evenly spaced, so the decoder can pick and shrink them itself
+    step = targets[1] - targets[0] if len(targets) > 1 else 1
+    with MediaSource(video_path, cache_frames=0) as source:
+        if mode == "encode":
+            frames = source.decode_frames(
+                range(frame_numbers[0], frame_numbers[-1] + 1, step),
+                upload_frame_size(source, upload_size)
+            )
+            return list(encode_frames(frames, source.fps, upload_size))
+
+        frames = source.decode_frames(
+            range(targets[0], targets[-1] + 1, step),
+            source.scaled_size(width=motion_width), pix_fmt="gray"
+        )
+        scored_frames, energies = motion_pass(MotionScorer(motion_width), frames)
+        if previous is not None and scored_frames and scored_frames[0] == previous:
+            scored_frames, energies = scored_frames[1:], energies[1:]
+        return scored_frames, energies
+
 
 class ActionDetector:
-    def __init__(self, api_key=None):
-        if not api_key:
+    def __init__(self, api_key=None, batch_size=MAX_VISION_BATCH, max_in_flight=4, cache=None, client=None):
+        # An existing client (e.g. a local stub) can be passed instead of a key file
+        if client is None and not api_key:
             raise ValueError("API key path is required")
             
         # Ensure the key file exists
-        if not os.path.exists(api_key):
+        if client is None and not os.path.exists(api_key):
             raise FileNotFoundError(f"Google Cloud key file not found at: {api_key}")
+
+        if not 1 <= batch_size <= MAX_VISION_BATCH:
+            raise ValueError(f"batch_size must be between 1 and {MAX_VISION_BATCH}")
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.cache = cache  # optional ResponseCache of scores keyed by JPEG bytes
+        # Longest side of frames sent to Vision; None sends them at full resolution
+        self.upload_size = 1024
+
+        # Local motion cascade settings (used when prefilter=True)
+        self.motion_scorer = MotionScorer()
+        self.motion_interval = 0.5  # seconds between locally scored frames
+        self.motion_window = 5.0  # seconds per candidate window
+        self.max_remote_frames = 8  # windows forwarded to Vision
+        self.min_motion = 1.0  # windows quieter than this are never sent
+        self.speech_boost = 0.5  # extra motion weight for frames during speech
+
+        # Coarse-to-fine search settings (used when search="adaptive")
+        self.coarse_samples = 20  # uniform samples in the first pass
+        self.refine_top = 2  # best frames refined around in each round
+        self.target_resolution = 2.0  # seconds between neighbouring samples
+        self.frame_budget = 60  # maximum frames sent to Vision
+
+        if client is not None:
+            self.client = client
+            return
             
         # Set the environment variable
         os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = api_key
@@ -20,84 +190,347 @@ class ActionDetector:
             # Create the client after setting environment variable
             self.client = vision.ImageAnnotatorClient()
         except Exception as e:
-            print(f"Error initializing Vision API client: {str(e)}")
+            get_telemetry().event("vision_client_init_failed", level="error", error=str(e))
             raise
 
-    def detect_key_moment(self, video_path):
+    def detect_key_moment(self, video, sampling="sequential", prefilter=False, search="uniform", speech_segments=None, workers=1):
         """
         Uses Google Cloud Vision to analyze frames and find the most active moments
-        Returns list of (timestamp, score) tuples sorted by activity level
+        Returns list of (timestamp, score) tuples in timestamp order; use
+        top_moments for the highest-scoring, non-overlapping moments
+
+        video is either a path or a MediaSource shared with the other stages,
+        in which case its cached metadata and decoder are reused.
+
+        sampling="sequential" decodes the video forward once, with ffmpeg
+        shrinking the samples to upload_size, and sends frames to Vision in
+        batches; sampling="seek" seeks to every sample and sends one request
+        per frame. Both score the same timestamps.
+
+        prefilter=True runs the local motion scorer over the whole video first
+        and only sends the peak frame of the most active windows to Vision.
+        speech_segments, a list of (start, end) seconds from the audio VAD,
+        raises the local score of frames during speech by speech_boost.
+
+        search="adaptive" replaces the fixed 20 samples with a coarse pass
+        followed by refinement around the best frames until neighbouring
+        samples are target_resolution seconds apart or frame_budget is spent.
+
+        workers > 1 splits the sequential decode (uniform sampling or the
+        motion prefilter pass) into keyframe-aligned time shards, each decoded
+        in its own process with its own capture. The shards' frames are merged
+        in order before scoring, so results are identical to workers=1.
+        Vision requests are still sent from this process. Shards seek by time,
+        which only finds the same frames for constant frame rate video;
+        variable frame rate video is decoded in one process instead.
         """
-        if not os.path.exists(video_path):
-            raise FileNotFoundError(f"Video file not found at: {video_path}")
+        if sampling not in ("sequential", "seek"):
+            raise ValueError(f"Unknown sampling mode: {sampling}")
+        if search not in ("uniform", "adaptive"):
+            raise ValueError(f"Unknown search mode: {search}")
+        if prefilter and search == "adaptive":
+            raise ValueError("prefilter cannot be combined with adaptive search")
+        if workers > 1 and (search == "adaptive" or sampling == "seek"):
+            raise ValueError("workers > 1 requires sequential sampling and uniform search")
+
+        owns_source = not isinstance(video, MediaSource)
+        source = MediaSource(video) if owns_source else video
+        if workers > 1 and not source.constant_frame_rate:
+            get_telemetry().event("detect_shards_disabled", level="warning", reason="variable frame rate")
+            workers = 1
+
+        try:
+            with get_telemetry().span(
+                "detect_key_moment", sampling=sampling, prefilter=prefilter, search=search, workers=workers
+            ) as span:
+                if prefilter:
+                    moments = self._detect_with_prefilter(source, speech_segments, workers)
+                elif search == "adaptive":
+                    moments = self._detect_adaptive(source)
+                else:
+                    moments = self._detect_uniform(source, sampling, workers)
+                span.set(scored_frames=len(moments))
+                return moments
+        finally:
+            if owns_source:
+                source.close()
 
-        video = VideoFileClip(video_path)
-        fps = video.fps
-        duration = video.duration
-        total_frames = int(fps * duration)
+    def top_moments(self, video, k=3, window=25, **detect_options):
+        """
+        Returns up to k (timestamp, score) moments, highest score first, whose
+        window-second clips around them do not overlap
+        detect_options are passed on to detect_key_moment
+        """
+        return select_top_moments(self.detect_key_moment(video, **detect_options), k, window)
+
+    def _detect_uniform(self, source, sampling, workers=1):
+        """Scores 20 evenly spaced frames."""
+        total_frames = source.total_frames
         
         # Sample frames throughout video
         sample_interval = max(total_frames // 20, 1)  # 20 samples
+        frame_numbers = range(0, total_frames, sample_interval)
+
+        if workers > 1:
+            encoded = self._scan_sharded(source, frame_numbers, "encode", workers)
+            return self._score_frames(encoded, self.batch_size, self.max_in_flight)
+
+        if sampling == "seek":
+            frames = source.read_frames(frame_numbers, seek=True)
+            batch_size, max_in_flight = 1, 1
+        else:
+            frames = source.decode_frames(frame_numbers, upload_frame_size(source, self.upload_size))
+            batch_size, max_in_flight = self.batch_size, self.max_in_flight
+        encoded = self._encode_frames(frames, source.fps)
+        return self._score_frames(encoded, batch_size, max_in_flight)
+
+    def _detect_with_prefilter(self, source, speech_segments=None, workers=1):
+        """
+        Two-stage cascade: local motion energy over densely sampled frames,
+        then Vision scoring of the peak frame in the top windows only.
+        """
+        fps = source.fps
+        stride = max(int(round(fps * self.motion_interval)), 1)
+        window_frames = max(int(round(fps * self.motion_window)), stride)
+
+        samples = range(0, source.total_frames, stride)
+        if workers > 1:
+            frame_numbers, energies = self._scan_sharded(source, samples, "motion", workers)
+        else:
+            frame_numbers, energies = self._motion_pass(source, samples)
+        if speech_segments:
+            in_speech = speech_mask(np.asarray(frame_numbers) / fps, speech_segments)
+            energies = energies * (1 + self.speech_boost * in_speech)
+        selected = select_active_windows(
+            frame_numbers, energies, window_frames,
+            self.max_remote_frames, self.min_motion
+        )
+        get_telemetry().event("motion_prefilter", kept=len(selected), sampled=len(frame_numbers))
+
+        # Few frames are left, so seeking beats decoding forward again
+        frames = source.read_frames(selected, seek=True)
+        encoded = self._encode_frames(frames, fps)
+        return self._score_frames(encoded, self.batch_size, self.max_in_flight)
+
+    def _detect_adaptive(self, source):
+        """
+        Hierarchical search: score a coarse uniform grid, then repeatedly halve
+        the spacing and score the neighbours of the refine_top best frames.
+        Each round costs at most 2 * refine_top frames, so reaching the target
+        resolution takes a number of rounds logarithmic in the video length.
+        """
+        fps = source.fps
+        total_frames = source.total_frames
+        if total_frames <= 0:
+            return []
+
+        # The first pass spans the whole video even when the budget is smaller
+        # than the coarse grid, so truncating it never leaves the end unscored
+        coarse_samples = max(min(self.coarse_samples, self.frame_budget), 1)
+        spacing = max(math.ceil(total_frames / coarse_samples), 1)
+        target_spacing = max(int(fps * self.target_resolution), 1)
+        scores = {}
+        attempted = set()
+
+        candidates = list(range(0, total_frames, spacing))
+        while True:
+            candidates = candidates[:max(self.frame_budget - len(attempted), 0)]
+            attempted.update(candidates)
+
+            frames = source.read_frames(candidates, seek=True)
+            encoded = self._encode_frames(frames, fps)
+            for timestamp, score in self._score_frames(encoded, self.batch_size, self.max_in_flight):
+                scores[int(round(timestamp * fps))] = score
+
+            if spacing <= target_spacing or not scores or len(attempted) >= self.frame_budget:
+                break
+            spacing = max(spacing // 2, 1)
+
+            # Highest score first, earliest frame breaks ties
+            best = sorted(scores, key=lambda f: (-scores[f], f))[:self.refine_top]
+            candidates = sorted({
+                neighbour
+                for frame_num in best
+                for neighbour in (frame_num - spacing, frame_num + spacing)
+                if 0 <= neighbour < total_frames and neighbour not in attempted
+            })
+
+        get_telemetry().event("adaptive_search", scored=len(scores), resolution=round(spacing / fps, 3))
+        return [(frame_num / fps, scores[frame_num]) for frame_num in sorted(scores)]
+
+    def _motion_pass(self, source, frame_numbers, block_size=256):
+        """
+        Decodes forward once and returns (frame_numbers, energies) for the
+        sampled frames, an evenly spaced range. ffmpeg decodes them straight
+        to grayscale thumbnails, which are scored in blocks to stay
+        vectorized without holding the whole video in memory.
+        """
+        size = source.scaled_size(width=self.motion_scorer.width)
+        frames = source.decode_frames(frame_numbers, size, pix_fmt="gray")
+        return motion_pass(self.motion_scorer, frames, block_size=block_size)
+
+    def _scan_sharded(self, source, frame_numbers, mode, workers):
+        """
+        Runs _scan_shard over keyframe-aligned shards of frame_numbers in
+        parallel and merges the results in frame order.
+        """
+        # Only the packets near each split point are probed, not the whole video
+        frame_numbers = list(frame_numbers)
+        keyframes = set()
+        for target in shard_targets(frame_numbers, workers):
+            time_s = target / source.fps
+            keyframes.update(int(round(t * source.fps)) for t in source.keyframe_times(time_s, time_s))
+        keyframes = sorted(keyframes)
+        shards = plan_shards(frame_numbers, keyframes, workers)
+        get_telemetry().event("detect_shards", shards=len(shards), workers=workers)
+
+        # spawn, not fork: the parent may already hold gRPC and thread pool state
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=max(len(shards), 1), mp_context=context) as pool:
+            futures = [
+                pool.submit(
+                    _scan_shard, source.video_path, group, previous, mode,
+                    self.motion_scorer.width, self.upload_size
+                )
+                for group, previous in shards
+            ]
+            results = [future.result() for future in futures]
+
+        if mode == "encode":
+            return [item for result in results for item in result]
+        scored_frames = [frame_num for numbers, _ in results for frame_num in numbers]
+        energies = np.concatenate([e for _, e in results]) if results else np.zeros(0, dtype=np.float32)
+        return scored_frames, energies
+
+    def _encode_frames(self, frames, fps):
+        """Yields (timestamp, jpeg_bytes) for each decoded frame, shrunk to upload_size."""
+        return encode_frames(frames, fps, self.upload_size)
+
+    def _score_frames(self, encoded, batch_size, max_in_flight):
+        """
+        Sends encoded frames to Vision in batches of batch_size, keeping up to
+        max_in_flight requests running. Returns (timestamp, score) in input order.
+        """
         moments = []
-        
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            raise ValueError(f"Failed to open video file: {video_path}")
-        
-        for frame_num in range(0, total_frames, sample_interval):
-            timestamp = frame_num / fps
-            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
-            ret, frame = cap.read()
-            
-            if not ret:
+        with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+            pending = []
+            batch = []
+            for item in encoded:
+                batch.append(item)
+                if len(batch) == batch_size:
+                    pending.append(pool.submit(self._annotate_batch, batch))
+                    batch = []
+                # Collect finished batches in order so memory stays bounded
+                while len(pending) > max_in_flight:
+                    moments.extend(pending.pop(0).result())
+            if batch:
+                pending.append(pool.submit(self._annotate_batch, batch))
+            for future in pending:
+                moments.extend(future.result())
+        return moments
+
+    def _annotate_batch(self, batch):
+        """
+        Scores a batch of (timestamp, jpeg_bytes) with one Vision request.
+        Frames already in the response cache are not sent.
+        """
+        cached = {}
+        if self.cache is not None:
+            for index, (_, content) in enumerate(batch):
+                value = self.cache.get(self._cache_key(content))
+                if value is not None:
+                    cached[index] = float(value)
+        remote_indices = [index for index in range(len(batch)) if index not in cached]
+
+        scores = dict(cached)
+        if remote_indices:
+            remote = [batch[index] for index in remote_indices]
+            scores.update(zip(remote_indices, self._annotate_remote(remote)))
+
+        moments = []
+        for index, (timestamp, _) in enumerate(batch):
+            if scores.get(index) is None:
                 continue
-                
-            # Encode frame for Vision API
-            success, buffer = cv2.imencode('.jpg', frame)
-            if not success:
-                print(f"Failed to encode frame at {timestamp:.2f}s")
+            moments.append((timestamp, scores[index]))
+        return moments
+
+    def _annotate_remote(self, batch):
+        """
+        Sends a batch to Vision and returns one score per frame, None where
+        the frame could not be scored.
+        """
+        features = [
+            vision.Feature(type_=vision.Feature.Type.OBJECT_LOCALIZATION),
+            vision.Feature(type_=vision.Feature.Type.FACE_DETECTION)
+        ]
+        requests = [
+            vision.AnnotateImageRequest(image=vision.Image(content=content), features=features)
+            for _, content in batch
+        ]
+
+        telemetry = get_telemetry()
+        uploaded = sum(len(content) for _, content in batch)
+        telemetry.count("bytes_uploaded_total", uploaded, api="vision")
+        with telemetry.span("remote_call", call="vision.batch_annotate_images", frames=len(batch), bytes=uploaded) as span:
+            started = time.perf_counter()
+            try:
+                response = self.client.batch_annotate_images(requests=requests)
+            except Exception as e:
+                telemetry.count("api_requests_total", call="vision.batch_annotate_images", status="error")
+                span.set(error=str(e))
+                for timestamp, _ in batch:
+                    telemetry.event("frame_analysis_failed", level="error", timestamp=round(timestamp, 2), error=str(e))
+                return [None] * len(batch)
+            finally:
+                telemetry.observe("api_latency_seconds", time.perf_counter() - started, call="vision.batch_annotate_images")
+            telemetry.count("api_requests_total", call="vision.batch_annotate_images", status="ok")
+
+        scores = []
+        for (timestamp, content), result in zip(batch, response.responses):
+            # A failed image comes back with an error status and no annotations;
+            # scoring it would cache a bogus minimum score for the frame
+            error = getattr(result, "error", None)
+            if error is not None and error.message:
+                telemetry.event("frame_analysis_failed", level="error", timestamp=round(timestamp, 2), error=error.message)
+                scores.append(None)
                 continue
-            content = buffer.tobytes()
-            
             try:
-                # Create image object and feature
-                image = vision.Image(content=content)
-                features = [
-                    vision.Feature(type_=vision.Feature.Type.OBJECT_LOCALIZATION),
-                    vision.Feature(type_=vision.Feature.Type.FACE_DETECTION)
-                ]
-                request = vision.AnnotateImageRequest(image=image, features=features)
-                response = self.client.batch_annotate_images(requests=[request])
-                
-                # Get annotations
-                result = response.responses[0]
-                objects = result.localized_object_annotations
-                faces = result.face_annotations
-                
-                # Calculate activity score based on:
-                # - Number of detected objects (movement/activity)
-                # - Face detection results (expressions, angles)
-                # - Object positions and sizes
-                
-                object_score = min(len(objects) / 5, 1.0) * 4  # Up to 4 points for objects
-                
-                face_score = 0
-                for face in faces:
-                    # Add points for non-neutral expressions
-                    if face.anger_likelihood >= 3: face_score += 2
-                    if face.surprise_likelihood >= 3: face_score += 1
-                    if abs(face.pan_angle) > 30: face_score += 1  # Quick head movement
-                
-                face_score = min(face_score, 6)  # Cap face score at 6 points
-                
-                total_score = object_score + face_score
-                normalized_score = max(1, min(10, total_score))  # Scale to 1-10
-                
-                moments.append((timestamp, normalized_score))
-                print(f"Analyzed frame at {timestamp:.2f}s - Activity Score: {normalized_score:.1f}")
-                
+                normalized_score = self._score_annotation(result)
             except Exception as e:
-                print(f"Error analyzing frame at {timestamp:.2f}s: {str(e)}")
+                telemetry.event("frame_analysis_failed", level="error", timestamp=round(timestamp, 2), error=str(e))
+                scores.append(None)
+                continue
+            if self.cache is not None:
+                self.cache.put(self._cache_key(content), repr(normalized_score))
+            telemetry.event("frame_analyzed", timestamp=round(timestamp, 2), score=round(normalized_score, 1))
+            scores.append(normalized_score)
+        return scores
+
+    @staticmethod
+    def _cache_key(content):
+        return ResponseCache.make_key(content, VISION_CACHE_MODEL, VISION_CACHE_PROMPT)
+
+    @staticmethod
+    def _score_annotation(result):
+        """Turns one AnnotateImageResponse into a 1-10 activity score."""
+        objects = result.localized_object_annotations
+        faces = result.face_annotations
         
-        cap.release()
-        return moments
+        # Calculate activity score based on:
+        # - Number of detected objects (movement/activity)
+        # - Face detection results (expressions, angles)
+        # - Object positions and sizes
+        
+        object_score = min(len(objects) / 5, 1.0) * 4  # Up to 4 points for objects
+        
+        face_score = 0
+        for face in faces:
+            # Add points for non-neutral expressions
+            if face.anger_likelihood >= 3: face_score += 2
+            if face.surprise_likelihood >= 3: face_score += 1
+            if abs(face.pan_angle) > 30: face_score += 1  # Quick head movement
+        
+        face_score = min(face_score, 6)  # Cap face score at 6 points
+        
+        total_score = object_score + face_score
+        return max(1, min(10, total_score))  # Scale to 1-10
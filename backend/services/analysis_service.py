@@ -0,0 +1,316 @@
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from telemetry import configure_from_env, get_telemetry
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while every worker and queue slot is taken."""
+
+
+class Job:
+    def __init__(self, video_path):
+        self.id = uuid.uuid4().hex
+        self.video_path = video_path
+        self.status = 'queued'
+        self.stages = {}
+        self.events = []
+        self.result = None
+        self.error = None
+        self.created = time.time()
+
+    def snapshot(self):
+        return {
+            'id': self.id,
+            'video_path': self.video_path,
+            'status': self.status,
+            'stages': dict(self.stages),
+            'result': self.result,
+            'error': self.error,
+            'created': self.created,
+        }
+
+
+class AnalysisService:
+    """
+    Keeps one BodycamAnalysisWorkflow warm and runs analyze_footage jobs on it.
+
+    Jobs run on max_workers threads. At most max_queue further jobs wait for a
+    worker; submissions beyond that raise QueueFullError so callers get
+    backpressure instead of an unbounded backlog.
+
+    With media_root set, only videos inside it can be submitted; relative
+    paths are resolved against it. Only the max_finished most recently
+    finished jobs are kept, so a long-running service does not hold every
+    result forever.
+    """
+
+    def __init__(self, workflow, max_workers=2, max_queue=8, media_root=None, max_finished=100):
+        self.workflow = workflow
+        self.media_root = os.path.realpath(media_root) if media_root else None
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analysis')
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._jobs = {}
+        self._finished = []  # ids of finished jobs, oldest first
+        self._changed = threading.Condition()
+
+    def submit(self, video_path):
+        if self.media_root:
+            video_path = os.path.realpath(os.path.join(self.media_root, video_path))
+            if os.path.commonpath([self.media_root, video_path]) != self.media_root:
+                raise PermissionError("Video path is outside the media root")
+        if not os.path.exists(video_path):
+            raise FileNotFoundError(f"Video file not found at: {video_path}")
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError("Analysis queue is full")
+
+        job = Job(video_path)
+        with self._changed:
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._changed:
+            job = self._jobs.get(job_id)
+            return job.snapshot() if job else None
+
+    def list(self):
+        with self._changed:
+            return [job.snapshot() for job in self._jobs.values()]
+
+    def events(self, job_id, after=0, timeout=15.0):
+        """
+        Returns (events, finished) for events after index `after`, waiting up
+        to timeout seconds for a new one.
+        """
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None:
+                raise KeyError(job_id)
+            self._changed.wait_for(
+                lambda: len(job.events) > after or job.status in ('done', 'failed'), timeout
+            )
+            return job.events[after:], job.status in ('done', 'failed')
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def _record(self, job, event, **fields):
+        with self._changed:
+            job.events.append({'event': event, 'time': time.time(), **fields})
+            self._changed.notify_all()
+
+    def _retire(self, job):
+        # Forget the oldest finished jobs beyond max_finished
+        with self._changed:
+            self._finished.append(job.id)
+            while len(self._finished) > self.max_finished:
+                self._jobs.pop(self._finished.pop(0), None)
+
+    def _run(self, job):
+        try:
+            with self._changed:
+                job.status = 'running'
+            self._record(job, 'running')
+
+            def progress(stage, status):
+                with self._changed:
+                    job.stages[stage] = status
+                self._record(job, 'stage', stage=stage, status=status)
+
+            result = self.workflow.analyze_footage(job.video_path, progress=progress)
+            with self._changed:
+                job.result = result
+                job.status = 'done'
+            self._record(job, 'done', result=result)
+        except Exception as e:
+            with self._changed:
+                job.error = str(e)
+                job.status = 'failed'
+            self._record(job, 'failed', error=str(e))
+        finally:
+            self._retire(job)
+            self._slots.release()
+
+
+class AnalysisRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /jobs              {"video_path": ...} -> 202 {"id", "status"}, 503 when full
+    GET  /jobs              all jobs
+    GET  /jobs/<id>         job status, per-stage progress and result
+    GET  /jobs/<id>/events  server-sent events until the job finishes
+    GET  /health
+    GET  /metrics           Prometheus text format
+
+    Browsers may only call the API from allowed_origin; cross-origin POSTs
+    from anywhere else are refused, as are POSTs that are not JSON, since
+    those skip the CORS preflight.
+    """
+
+    service = None  # set by make_server
+    allowed_origin = None  # set by make_server
+
+    def do_OPTIONS(self):
+        self._send_json(204, None)
+
+    def do_GET(self):
+        parts = urlparse(self.path).path.strip('/').split('/')
+        if parts == ['health']:
+            self._send_json(200, {'status': 'ok'})
+        elif parts == ['metrics']:
+            self._send_metrics()
+        elif parts == ['jobs']:
+            self._send_json(200, self.service.list())
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            job = self.service.get(parts[1])
+            if job is None:
+                self._send_json(404, {'error': 'Unknown job'})
+            else:
+                self._send_json(200, job)
+        elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'events':
+            self._stream_events(parts[1])
+        else:
+            self._send_json(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        if urlparse(self.path).path.strip('/') != 'jobs':
+            self._send_json(404, {'error': 'Not found'})
+            return
+        origin = self.headers.get('Origin')
+        if origin is not None and origin != self.allowed_origin:
+            self._send_json(403, {'error': 'Origin not allowed'})
+            return
+        if self.headers.get_content_type() != 'application/json':
+            self._send_json(415, {'error': 'Expected application/json'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+            video_path = body['video_path']
+        except (ValueError, KeyError, TypeError):
+            self._send_json(400, {'error': 'Expected JSON body with video_path'})
+            return
+
+        try:
+            job = self.service.submit(video_path)
+        except PermissionError as e:
+            self._send_json(403, {'error': str(e)})
+        except FileNotFoundError as e:
+            self._send_json(404, {'error': str(e)})
+        except QueueFullError as e:
+            self._send_json(503, {'error': str(e)}, {'Retry-After': '30'})
+        else:
+            self._send_json(202, {'id': job.id, 'status': job.status}, {'Location': f'/jobs/{job.id}'})
+
+    def _stream_events(self, job_id):
+        if self.service.get(job_id) is None:
+            self._send_json(404, {'error': 'Unknown job'})
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self._send_cors_headers()
+        self.end_headers()
+
+        sent = 0
+        finished = False
+        try:
+            while not finished:
+                try:
+                    events, finished = self.service.events(job_id, sent)
+                except KeyError:
+                    break  # the job was retired while streaming
+                for event in events:
+                    self.wfile.write(f"event: {event['event']}\ndata: {json.dumps(event, default=str)}\n\n".encode())
+                sent += len(events)
+                if not events:
+                    self.wfile.write(b": keep-alive\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _send_metrics(self):
+        body = get_telemetry().prometheus_text().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload, headers=None):
+        body = b'' if payload is None else json.dumps(payload, default=str).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self._send_cors_headers()
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def _send_cors_headers(self):
+        if self.allowed_origin is None:
+            return
+        self.send_header('Access-Control-Allow-Origin', self.allowed_origin)
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Vary', 'Origin')
+
+
+def make_server(service, host='127.0.0.1', port=8000, allowed_origin=None):
+    # allowed_origin is the frontend's origin, e.g. http://localhost:3000; None disallows browsers
+    handler = type(
+        'BoundAnalysisRequestHandler', (AnalysisRequestHandler,),
+        {'service': service, 'allowed_origin': allowed_origin}
+    )
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve bodycam analysis jobs over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=2, help="jobs analyzed at the same time")
+    parser.add_argument("--queue", type=int, default=8, help="jobs allowed to wait for a worker")
+    parser.add_argument("--media-root", default=os.getenv('ANALYSIS_MEDIA_ROOT', '.'),
+                        help="directory videos must be inside (default: current directory)")
+    parser.add_argument("--allowed-origin", default=os.getenv('ANALYSIS_ALLOWED_ORIGIN', 'http://localhost:3000'),
+                        help="frontend origin allowed to call the API from a browser")
+    args = parser.parse_args()
+
+    from main import BodycamAnalysisWorkflow
+
+    configure_from_env()
+    print("Loading models and clients...")
+    workflow = BodycamAnalysisWorkflow()
+    # Load CLIP now rather than on the first job
+    workflow.frame_extractor.text_embeddings()
+
+    service = AnalysisService(
+        workflow, max_workers=args.workers, max_queue=args.queue, media_root=args.media_root
+    )
+    server = make_server(service, args.host, args.port, args.allowed_origin)
+    print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
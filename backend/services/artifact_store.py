@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from response_cache import SQLITE_TIMEOUT
+from telemetry import get_telemetry
+
+DEFAULT_ARTIFACT_PATH = Path(__file__).resolve().parent / ".cache" / "artifacts"
+
+# Files up to this size are hashed whole; larger ones are sampled
+_FULL_HASH_LIMIT = 64 * 1024 * 1024
+_SAMPLE_BLOCKS = 16
+_BLOCK_SIZE = 1024 * 1024
+
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+
+def fingerprint_file(path: str) -> str:
+    """
+    Returns a content hash of a file, memoized per (path, size, mtime).
+
+    Files over 64 MB are hashed from their size and 16 evenly spaced 1 MB
+    blocks, which is enough to tell recordings apart without reading hours
+    of video.
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _fingerprints_lock:
+        if memo_key in _fingerprints:
+            return _fingerprints[memo_key]
+
+    digest = hashlib.sha256(stat.st_size.to_bytes(8, "big"))
+    with open(path, "rb") as f:
+        if stat.st_size <= _FULL_HASH_LIMIT:
+            for block in iter(lambda: f.read(_BLOCK_SIZE), b""):
+                digest.update(block)
+        else:
+            step = (stat.st_size - _BLOCK_SIZE) // (_SAMPLE_BLOCKS - 1)
+            for i in range(_SAMPLE_BLOCKS):
+                f.seek(i * step)
+                digest.update(f.read(_BLOCK_SIZE))
+
+    fingerprint = digest.hexdigest()
+    with _fingerprints_lock:
+        _fingerprints[memo_key] = fingerprint
+    return fingerprint
+
+
+def artifact_key(*parts) -> str:
+    """Hashes JSON-serializable parts into an artifact key."""
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def file_paths(value) -> list[str]:
+    """Finds the strings in a JSON-like value that name existing files."""
+    if isinstance(value, dict):
+        return [path for item in value.values() for path in file_paths(item)]
+    if isinstance(value, list):
+        return [path for item in value for path in file_paths(item)]
+    if isinstance(value, str) and os.path.isfile(value):
+        return [value]
+    return []
+
+
+class ArtifactStore:
+    """
+    Local store of workflow stage outputs keyed by a hash of their inputs.
+
+    An artifact is the JSON state a stage returned plus copies of the files it
+    wrote (clips, transcripts, frames), so a stage can be skipped even if its
+    files were cleaned up or overwritten by another run since. The index is a SQLite file; artifacts older
+    than max_age seconds are purged and the least recently used are evicted
+    once the store grows past max_bytes.
+    """
+
+    def __init__(
+        self,
+        path: str | Path = DEFAULT_ARTIFACT_PATH,
+        max_bytes: int = 5 * 1024 * 1024 * 1024,
+        max_age: float = 30 * 24 * 3600,
+    ):
+        """
+        Args:
+            path: Directory holding the index and the stored files.
+            max_bytes: Total stored file size above which LRU artifacts are evicted.
+            max_age: Seconds after which an artifact expires.
+        """
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path / "index.sqlite3", timeout=SQLITE_TIMEOUT, check_same_thread=False)
+        # Batch workers in other processes write the same index
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS artifacts ("
+            "key TEXT PRIMARY KEY, stage TEXT NOT NULL, state TEXT NOT NULL, files TEXT NOT NULL, "
+            "size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            row = self._db.execute("SELECT created FROM artifacts WHERE key = ?", (key,)).fetchone()
+        return row is not None and time.time() - row[0] <= self.max_age
+
+    def load(self, key: str) -> dict | None:
+        """
+        Returns the stored state for key, or None on a miss. Stored files that
+        are missing from their original paths, or whose content there has
+        changed, are copied back first.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT stage, state, files, created FROM artifacts WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[3] > self.max_age:
+                get_telemetry().count("artifact_requests_total", result="miss")
+                return None
+            stage, state, files, _ = row
+            self._db.execute("UPDATE artifacts SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+
+        for index, (original, fingerprint) in enumerate(json.loads(files)):
+            if not os.path.exists(original) or fingerprint_file(original) != fingerprint:
+                stored = self.path / key / f"{index}{Path(original).suffix}"
+                if not stored.exists():
+                    # Stored copy is gone too, so the artifact cannot be used
+                    self.delete(key)
+                    get_telemetry().count("artifact_requests_total", result="miss")
+                    return None
+                os.makedirs(os.path.dirname(original), exist_ok=True)
+                shutil.copy2(stored, original)
+
+        get_telemetry().count("artifact_requests_total", stage=stage, result="hit")
+        return json.loads(state)
+
+    def save(self, key: str, stage: str, state: dict, files: list[str] | None = None):
+        """
+        Stores a stage's state and copies of files, by default every existing
+        file the state names. Pass only the files the stage itself wrote, so
+        files carried over from earlier stages are not stored again.
+        """
+        if files is None:
+            files = file_paths(state)
+        directory = self.path / key
+        directory.mkdir(parents=True, exist_ok=True)
+        size = 0
+        entries = []
+        for index, original in enumerate(files):
+            stored = directory / f"{index}{Path(original).suffix}"
+            shutil.copy2(original, stored)
+            size += stored.stat().st_size
+            entries.append([original, fingerprint_file(original)])
+
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO artifacts (key, stage, state, files, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, stage, json.dumps(state), json.dumps(entries), size, now, now),
+            )
+            self._db.commit()
+            stale = [stale_key for stale_key in self._stale_keys(now) if stale_key != key]
+        for stale_key in stale:
+            self.delete(stale_key)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM artifacts WHERE key = ?", (key,))
+            self._db.commit()
+        shutil.rmtree(self.path / key, ignore_errors=True)
+
+    def gc(self) -> int:
+        """Removes expired and over-budget artifacts and returns how many were removed."""
+        with self._lock:
+            stale = self._stale_keys(time.time())
+        for key in stale:
+            self.delete(key)
+        return len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM artifacts"
+            ).fetchone()
+        return {"entries": entries, "bytes": size}
+
+    def close(self):
+        self._db.close()
+
+    def _stale_keys(self, now) -> list[str]:
+        stale = [
+            key for (key,) in self._db.execute(
+                "SELECT key FROM artifacts WHERE created < ?", (now - self.max_age,)
+            ).fetchall()
+        ]
+        (size,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM artifacts WHERE created >= ?", (now - self.max_age,)
+        ).fetchone()
+        if size > self.max_bytes:
+            rows = self._db.execute(
+                "SELECT key, size FROM artifacts WHERE created >= ? ORDER BY accessed", (now - self.max_age,)
+            ).fetchall()
+            for key, entry_size in rows:
+                if size <= self.max_bytes:
+                    break
+                stale.append(key)
+                size -= entry_size
+        return stale
@@ -0,0 +1,267 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from main import BodycamAnalysisWorkflow
+from video_trimmer import is_clip_path
+from telemetry import configure_from_env, get_telemetry
+
+# Trim and CLIP stages run in worker processes; stages that call an API (detect
+# included, whose decode happens in ffmpeg) run as threads in the main process so
+# many videos can wait on the network at once.
+CPU_STAGES = set(BodycamAnalysisWorkflow.LOCAL_STAGES)
+# Each worker loads its own CLIP model, and torch already spreads one model's
+# inference over every core, so a few workers keep the cores busy
+DEFAULT_CPU_WORKERS = 2
+VIDEO_EXTENSIONS = {'.mp4', '.mov', '.m4v', '.avi', '.mkv'}
+
+
+class JobStore:
+    """
+    SQLite record of every video's per-stage progress.
+
+    A job's state (the dict the workflow stages build up) is saved after each
+    completed stage, so a restarted batch resumes from the last completed
+    stage of every unfinished video.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                video_path TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                state TEXT NOT NULL,
+                error TEXT,
+                updated REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS stages (
+                video_path TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                status TEXT NOT NULL,
+                started REAL,
+                finished REAL,
+                error TEXT,
+                PRIMARY KEY (video_path, stage)
+            );
+            """
+        )
+        self._db.commit()
+
+    def add(self, video_path):
+        """Registers a video unless it is already known."""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO jobs (video_path, status, state, updated) VALUES (?, 'pending', '{}', ?)",
+                (video_path, time.time()),
+            )
+            self._db.commit()
+
+    def unfinished(self):
+        """Returns the paths of jobs that are not done, in insertion order."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT video_path FROM jobs WHERE status != 'done' ORDER BY rowid"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def load(self, video_path):
+        """Returns (completed stages, state) for a job."""
+        with self._lock:
+            (state,) = self._db.execute(
+                "SELECT state FROM jobs WHERE video_path = ?", (video_path,)
+            ).fetchone()
+            rows = self._db.execute(
+                "SELECT stage FROM stages WHERE video_path = ? AND status = 'done'", (video_path,)
+            ).fetchall()
+        return {row[0] for row in rows}, json.loads(state)
+
+    def start_stage(self, video_path, stage):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO stages (video_path, stage, status, started) VALUES (?, ?, 'running', ?)",
+                (video_path, stage, time.time()),
+            )
+            self._db.execute(
+                "UPDATE jobs SET status = 'running', updated = ? WHERE video_path = ?",
+                (time.time(), video_path),
+            )
+            self._db.commit()
+
+    def finish_stage(self, video_path, stage, state):
+        """Marks a stage done and saves the job state in one transaction."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE stages SET status = 'done', finished = ? WHERE video_path = ? AND stage = ?",
+                (now, video_path, stage),
+            )
+            self._db.execute(
+                "UPDATE jobs SET state = ?, updated = ? WHERE video_path = ?",
+                (json.dumps(state), now, video_path),
+            )
+            self._db.commit()
+
+    def fail_stage(self, video_path, stage, error):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE stages SET status = 'failed', finished = ?, error = ? WHERE video_path = ? AND stage = ?",
+                (now, error, video_path, stage),
+            )
+            self._db.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated = ? WHERE video_path = ?",
+                (error, now, video_path),
+            )
+            self._db.commit()
+
+    def finish(self, video_path):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'done', error = NULL, updated = ? WHERE video_path = ?",
+                (time.time(), video_path),
+            )
+            self._db.commit()
+
+    def summary(self):
+        """Returns the number of jobs in each status."""
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+
+def discover_videos(target):
+    """
+    Returns video paths from a directory (searched recursively) or a manifest
+    file with one path per line or a JSON list. Relative manifest entries are
+    resolved against the manifest's directory. Clips that earlier runs cut
+    into the directory are skipped, so a rerun does not analyze its own output.
+    """
+    target = Path(target)
+    if target.is_dir():
+        return sorted(
+            str(path.resolve()) for path in target.rglob('*')
+            if path.suffix.lower() in VIDEO_EXTENSIONS and not is_clip_path(path)
+        )
+
+    text = target.read_text()
+    try:
+        entries = json.loads(text)
+    except json.JSONDecodeError:
+        entries = [line.strip() for line in text.splitlines()]
+    entries = [entry for entry in entries if entry and not entry.startswith('#')]
+    return [str((target.parent / entry).resolve()) for entry in entries]
+
+
+_worker_workflow = None
+
+
+def _init_worker():
+    global _worker_workflow
+    configure_from_env()
+    # Workers only run CPU_STAGES, so they need no API clients or response cache
+    _worker_workflow = BodycamAnalysisWorkflow(api_clients=False)
+
+
+def _run_cpu_stage(stage, video_path, state):
+    return _worker_workflow.run_stage(stage, video_path, state)
+
+
+class BatchRunner:
+    """
+    Runs many videos through BodycamAnalysisWorkflow's stages as a pipeline.
+
+    Every video advances through the stages on its own, so one video can be in
+    CLIP while another waits on the OpenAI API. CPU stages run in a process
+    pool of cpu_workers; API stages run in at most api_workers threads.
+    max_active bounds how many videos are in flight at once.
+    """
+
+    def __init__(self, store, cpu_workers=None, api_workers=8, max_active=None):
+        self.store = store
+        self.cpu_workers = cpu_workers or min(DEFAULT_CPU_WORKERS, os.cpu_count() or 1)
+        self.api_workers = api_workers
+        self.max_active = max_active or 2 * (self.cpu_workers + api_workers)
+        self.workflow = None
+
+    def run(self, video_paths):
+        for video_path in video_paths:
+            self.store.add(video_path)
+        try:
+            asyncio.run(self._run_all(self.store.unfinished()))
+        finally:
+            get_telemetry().flush()
+        return self.store.summary()
+
+    async def _run_all(self, video_paths):
+        if not video_paths:
+            return
+        self.workflow = BodycamAnalysisWorkflow()
+        active = asyncio.Semaphore(self.max_active)
+        api_slots = asyncio.Semaphore(self.api_workers)
+
+        # spawn, not fork: this process already holds the gRPC Vision client, which is not fork-safe
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(
+            max_workers=self.cpu_workers, initializer=_init_worker, mp_context=context
+        ) as pool:
+            async def run_job(video_path):
+                async with active:
+                    await self._run_job(video_path, pool, api_slots)
+
+            await asyncio.gather(*(run_job(video_path) for video_path in video_paths))
+
+    async def _run_job(self, video_path, pool, api_slots):
+        loop = asyncio.get_running_loop()
+        completed, state = self.store.load(video_path)
+
+        for stage in BodycamAnalysisWorkflow.STAGES:
+            if stage in completed:
+                continue
+            self.store.start_stage(video_path, stage)
+            try:
+                if stage in CPU_STAGES:
+                    update = await loop.run_in_executor(pool, _run_cpu_stage, stage, video_path, state)
+                else:
+                    async with api_slots:
+                        update = await asyncio.to_thread(self.workflow.run_stage, stage, video_path, state)
+            except Exception as e:
+                get_telemetry().event('stage_failed', level='error', stage=stage, video=video_path, error=str(e))
+                self.store.fail_stage(video_path, stage, str(e))
+                return
+
+            state = {**state, **update}
+            self.store.finish_stage(video_path, stage, state)
+            get_telemetry().event('stage_completed', stage=stage, video=video_path)
+            if state.get('key_timestamp') is None:
+                break
+
+        self.store.finish(video_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze a directory or manifest of bodycam videos.")
+    parser.add_argument("target", help="directory of videos, or a manifest file (one path per line or a JSON list)")
+    parser.add_argument("--db", default="jobs.sqlite3", help="SQLite job table used to resume interrupted batches")
+    parser.add_argument("--cpu-workers", type=int, default=None,
+                        help=f"processes for trimming and CLIP (default: {DEFAULT_CPU_WORKERS})")
+    parser.add_argument("--api-workers", type=int, default=8)
+    args = parser.parse_args()
+
+    configure_from_env()
+    runner = BatchRunner(JobStore(args.db), cpu_workers=args.cpu_workers, api_workers=args.api_workers)
+    summary = runner.run(discover_videos(args.target))
+    print("Batch finished:", ", ".join(f"{count} {status}" for status, count in summary.items()))
+
+
+if __name__ == "__main__":
+    main()
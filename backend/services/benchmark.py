@@ -0,0 +1,472 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+
+import cv2
+import ffmpeg
+import numpy as np
+
+from telemetry import configure, peak_memory_mb
+from wav_buffer import wav_header
+
+# (duration seconds, width, height) of the synthetic videos in each profile
+PROFILES = {
+    'quick': [(30, 640, 360), (120, 1280, 720)],
+    'full': [(30, 640, 360), (120, 1280, 720), (600, 1280, 720), (120, 1920, 1080)],
+}
+CASES = (
+    'detect_uniform', 'detect_prefilter', 'detect_prefilter_sharded', 'detect_adaptive',
+    'trim', 'trim_exact', 'frames', 'audio', 'audio_streaming', 'analyze_footage',
+)
+DEFAULT_WORK_DIR = Path(__file__).resolve().parent / '.cache' / 'benchmark'
+DEFAULT_BASELINE = Path(__file__).resolve().parent / 'benchmark_baseline.json'
+SYNTHETIC_FPS = 30
+AUDIO_SAMPLE_RATE = 16000
+
+
+def make_synthetic_video(path, duration, width, height, fps=SYNTHETIC_FPS, seed=0):
+    """
+    Writes a deterministic H.264/AAC test video.
+
+    A slowly drifting box over a noisy background stands in for calm footage.
+    An 8 second burst of fast-moving shapes at 60% of the video gives the
+    detectors a clear key moment. The audio track has quiet noise, tonal
+    speech-like bursts and a loud passage during the burst.
+    """
+    rng = np.random.default_rng(seed)
+    incident = (0.6 * duration, 0.6 * duration + 8)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        audio_path = os.path.join(temp_dir, 'audio.wav')
+        pcm = _synthetic_audio(duration, incident, rng)
+        with open(audio_path, 'wb') as f:
+            f.write(wav_header(len(pcm), AUDIO_SAMPLE_RATE, 1, 2) + pcm)
+
+        video_in = ffmpeg.input('pipe:', format='rawvideo', pix_fmt='bgr24', s=f'{width}x{height}', r=fps)
+        process = (
+            ffmpeg.output(
+                video_in, ffmpeg.input(audio_path), str(path),
+                vcodec='libx264', preset='veryfast', pix_fmt='yuv420p', g=2 * fps,
+                acodec='aac', shortest=None,
+            )
+            .overwrite_output()
+            .global_args('-loglevel', 'error')
+            .run_async(pipe_stdin=True)
+        )
+        # A handful of noise frames cycled through keeps generation cheap at 1080p
+        noise = [rng.integers(20, 60, (height, width, 3), dtype=np.uint8) for _ in range(4)]
+        movers = rng.uniform(0, 1, (6, 4))
+        try:
+            for index in range(int(duration * fps)):
+                t = index / fps
+                frame = noise[index % len(noise)].copy()
+                x = int((0.2 + 0.1 * np.sin(t / 5)) * width)
+                cv2.rectangle(frame, (x, height // 3), (x + width // 6, height // 3 + height // 3), (90, 110, 130), -1)
+                if incident[0] <= t < incident[1]:
+                    for px, py, vx, vy in movers:
+                        cx = int((px + vx * t * 3) % 1 * width)
+                        cy = int((py + vy * t * 3) % 1 * height)
+                        cv2.circle(frame, (cx, cy), height // 10, (30, 40, 220), -1)
+                process.stdin.write(frame.tobytes())
+        finally:
+            process.stdin.close()
+            process.wait()
+    if process.returncode:
+        raise RuntimeError(f"ffmpeg failed to write {path}")
+    return path
+
+
+def _synthetic_audio(duration, incident, rng):
+    samples = int(duration * AUDIO_SAMPLE_RATE)
+    t = np.arange(samples) / AUDIO_SAMPLE_RATE
+    audio = rng.normal(0, 0.01, samples)
+    # Speech-like bursts: 1-3 s of amplitude-modulated harmonics every ~6 s
+    for start in np.arange(1.0, duration - 3, 6.0):
+        length = rng.uniform(1, 3)
+        mask = (t >= start) & (t < start + length)
+        pitch = rng.uniform(110, 220)
+        voice = sum(np.sin(2 * np.pi * pitch * k * t[mask]) / k for k in (1, 2, 3))
+        audio[mask] += 0.2 * voice * (0.5 + 0.5 * np.sin(2 * np.pi * 4 * t[mask]))
+    mask = (t >= incident[0]) & (t < min(incident[1], duration))
+    audio[mask] += 0.5 * np.sin(2 * np.pi * 440 * t[mask]) + rng.normal(0, 0.1, mask.sum())
+    return (np.clip(audio, -1, 1) * 32767).astype('<i2').tobytes()
+
+
+def synthetic_video(work_dir, duration, width, height):
+    """Returns the path of a synthetic video, creating it on first use."""
+    path = Path(work_dir) / 'videos' / f'synthetic_{duration}s_{width}x{height}.mp4'
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        print(f"Generating {path.name}...")
+        partial = path.with_name(path.stem + '_partial.mp4')
+        make_synthetic_video(partial, duration, width, height)
+        partial.rename(path)
+    return str(path)
+
+
+class FakeOpenAIServer:
+    """
+    Local HTTP stand-in for the OpenAI chat completions endpoint.
+
+    Every request sleeps latency plus up to jitter seconds, then returns a
+    canned completion (with a transcript for audio requests) and token usage.
+    Requests are counted by kind ('chat' or 'audio').
+    """
+
+    def __init__(self, latency=0.2, jitter=0.0, host='127.0.0.1', port=0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.counts = {}
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self):
+        with self._lock:
+            counts, self.counts = self.counts, {}
+        return counts
+
+    def _delay(self):
+        with self._lock:
+            return self.latency + self._random.uniform(0, self.jitter)
+
+    def _record(self, kind):
+        with self._lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if not self.path.rstrip('/').endswith('/chat/completions'):
+                    self._send(404, {'error': {'message': 'Not found'}})
+                    return
+                kind = 'audio' if 'audio' in (body.get('modalities') or []) else 'chat'
+                server._record(kind)
+                time.sleep(server._delay())
+                self._send(200, _fake_completion(body, kind))
+
+            def _send(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def _fake_completion(body, kind):
+    prompt_tokens = len(json.dumps(body.get('messages', []))) // 4
+    if kind == 'audio':
+        transcript = "officer: stop right there. subject: i did not do anything. officer: hands where i can see them."
+        message = {
+            'role': 'assistant',
+            'content': None,
+            'audio': {'id': 'audio_benchmark', 'data': '', 'expires_at': 0, 'transcript': transcript},
+        }
+        completion_tokens = len(transcript) // 4
+    else:
+        content = "Tension rises briefly as several people move quickly, then the scene calms."
+        message = {'role': 'assistant', 'content': content}
+        completion_tokens = len(content) // 4
+    return {
+        'id': 'chatcmpl-benchmark',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': body.get('model', 'benchmark'),
+        'choices': [{'index': 0, 'finish_reason': 'stop', 'message': message}],
+        'usage': {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+        },
+    }
+
+
+class FakeVisionClient:
+    """
+    In-process stand-in for vision.ImageAnnotatorClient.
+
+    batch_annotate_images sleeps latency plus up to jitter seconds and returns
+    annotations derived from a hash of each image, so the same frame always
+    gets the same score.
+    """
+
+    def __init__(self, latency=0.2, jitter=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+        self.images = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    def batch_annotate_images(self, requests):
+        with self._lock:
+            self.calls += 1
+            self.images += len(requests)
+            delay = self.latency + self._random.uniform(0, self.jitter)
+        time.sleep(delay)
+        return SimpleNamespace(responses=[self._annotate(request.image.content) for request in requests])
+
+    @staticmethod
+    def _annotate(content):
+        digest = hashlib.sha256(content).digest()
+        faces = [
+            SimpleNamespace(
+                anger_likelihood=digest[2 + i] % 6,
+                surprise_likelihood=digest[4 + i] % 6,
+                pan_angle=(digest[6 + i] - 128) / 2,
+            )
+            for i in range(digest[1] % 3)
+        ]
+        return SimpleNamespace(localized_object_annotations=[None] * (digest[0] % 8), face_annotations=faces)
+
+
+def _run_case(case, video_path, duration, openai_url, config):
+    """Runs one case in a fresh process and returns its measurements."""
+    telemetry = configure(log_path=os.devnull)
+    vision = FakeVisionClient(config['vision_latency'], config['jitter'])
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Outputs are written next to the input, so run on a link inside work_dir
+        video = os.path.join(work_dir, os.path.basename(video_path))
+        os.symlink(video_path, video)
+        os.environ['RESPONSE_CACHE_PATH'] = os.path.join(work_dir, 'responses.sqlite3')
+        os.environ['ARTIFACT_STORE_PATH'] = os.path.join(work_dir, 'artifacts')
+
+        run = _case_runner(case, video, duration, openai_url, vision)
+        started = time.perf_counter()
+        run()
+        wall_time = time.perf_counter() - started
+
+    snapshot = telemetry.snapshot()
+    return {
+        'wall_time': wall_time,
+        'throughput': duration / wall_time if wall_time else None,
+        'peak_rss_mb': peak_memory_mb(),
+        'vision_calls': vision.calls,
+        'vision_images': vision.images,
+        'stage_seconds': {
+            key.split('"')[1]: value['sum']
+            for key, value in snapshot['histograms'].items()
+            if key.startswith('span_duration_seconds{span="stage.')
+        },
+        'counters': snapshot['counters'],
+    }
+
+
+def _case_runner(case, video, duration, openai_url, vision):
+    """Builds the component for a case and returns a zero-argument callable that runs it."""
+    def openai_client():
+        from openai import OpenAI
+        return OpenAI(api_key='benchmark', base_url=openai_url, max_retries=0)
+
+    if case.startswith('detect_'):
+        from action_detector import ActionDetector
+        detector = ActionDetector(client=vision)
+        options = {
+            'detect_uniform': {},
+            'detect_prefilter': {'prefilter': True},
+            'detect_prefilter_sharded': {'prefilter': True, 'workers': os.cpu_count() or 1},
+            'detect_adaptive': {'search': 'adaptive'},
+        }[case]
+        return lambda: detector.detect_key_moment(video, **options)
+
+    if case in ('trim', 'trim_exact'):
+        from video_trimmer import VideoTrimmer
+        trimmer = VideoTrimmer()
+        return lambda: trimmer.trim_video(video, 0.6 * duration, exact=case == 'trim_exact')
+
+    if case == 'frames':
+        from frame_extractor import KeyFrameExtractor
+        extractor = KeyFrameExtractor()
+        # Model loading is a one-off cost, not part of the measured run
+        extractor.text_embeddings()
+        return lambda: extractor.extract_key_frames(video)
+
+    if case in ('audio', 'audio_streaming'):
+        from request_engine import RequestEngine
+        from subtitle_generator import AudioAnalyzer
+        analyzer = AudioAnalyzer(openai_client(), RequestEngine(max_concurrency=8))
+        return lambda: analyzer.analyze_mp4_audio(video, streaming=case == 'audio_streaming')
+
+    if case == 'analyze_footage':
+        from main import BodycamAnalysisWorkflow
+        workflow = BodycamAnalysisWorkflow(openai_client=openai_client(), vision_client=vision)
+        workflow.frame_extractor.text_embeddings()
+        return lambda: workflow.analyze_footage(video)
+
+    raise ValueError(f"Unknown benchmark case: {case}")
+
+
+def run_benchmarks(videos, cases, work_dir=DEFAULT_WORK_DIR, repeat=1, openai_latency=0.2, vision_latency=0.2, jitter=0.0):
+    """
+    Runs every case on every (duration, width, height) video against the local
+    fakes and returns the results document.
+
+    Each run happens in a new process so peak RSS is per case. wall_time is the
+    median over repeat runs; remote-call counts come from the first run.
+    """
+    config = {'vision_latency': vision_latency, 'jitter': jitter}
+    results = {
+        'created': time.time(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'config': {'repeat': repeat, 'openai_latency': openai_latency, 'vision_latency': vision_latency, 'jitter': jitter},
+        'cases': {},
+    }
+    server = FakeOpenAIServer(openai_latency, jitter).start()
+    context = multiprocessing.get_context('spawn')
+    try:
+        for duration, width, height in videos:
+            video_path = synthetic_video(work_dir, duration, width, height)
+            for case in cases:
+                name = f'{case}/{duration}s_{width}x{height}'
+                runs = []
+                try:
+                    for _ in range(repeat):
+                        server.reset()
+                        # Not multiprocessing.Pool: its workers are daemonic and could not
+                        # start the process pool of the sharded detector
+                        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                            run = pool.submit(_run_case, case, video_path, duration, server.base_url, config).result()
+                        run['openai_calls'] = server.reset()
+                        runs.append(run)
+                except Exception as e:
+                    print(f"{name}: failed ({e})")
+                    results['cases'][name] = {'error': str(e)}
+                    continue
+
+                result = dict(runs[0])
+                result['wall_time'] = statistics.median(run['wall_time'] for run in runs)
+                result['throughput'] = duration / result['wall_time'] if result['wall_time'] else None
+                result['peak_rss_mb'] = max(run['peak_rss_mb'] for run in runs)
+                result['wall_times'] = [run['wall_time'] for run in runs]
+                result['remote_calls'] = {'vision': result.pop('vision_calls'), **result.pop('openai_calls')}
+                results['cases'][name] = result
+                print(
+                    f"{name}: {result['wall_time']:.2f}s, {result['throughput']:.1f}x realtime, "
+                    f"{result['peak_rss_mb']:.0f} MB peak, remote calls {result['remote_calls']}"
+                )
+    finally:
+        server.stop()
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance=0.2):
+    """
+    Returns regression messages for cases that failed, whose wall time or
+    peak RSS grew by more than tolerance, or that made more remote calls than
+    the baseline. Cases missing from the baseline are only checked for failure.
+    """
+    regressions = []
+    for name, case in results['cases'].items():
+        base = baseline.get('cases', {}).get(name)
+        if 'error' in case:
+            if base and 'error' not in base:
+                regressions.append(f"{name}: failed ({case['error']}) but passed in the baseline")
+            else:
+                regressions.append(f"{name}: failed ({case['error']})")
+            continue
+        if not base or 'error' in base:
+            continue
+        for metric in ('wall_time', 'peak_rss_mb'):
+            if case[metric] > base[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{name}: {metric} {case[metric]:.2f} vs baseline {base[metric]:.2f} "
+                    f"(+{(case[metric] / base[metric] - 1) * 100:.0f}%)"
+                )
+        for kind, count in case['remote_calls'].items():
+            if count > base['remote_calls'].get(kind, 0):
+                regressions.append(f"{name}: {count} {kind} calls vs baseline {base['remote_calls'].get(kind, 0)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline offline on synthetic footage.")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="quick")
+    parser.add_argument("--cases", default=",".join(CASES), help="comma-separated subset of: " + ", ".join(CASES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--openai-latency", type=float, default=0.2, help="seconds per fake OpenAI request")
+    parser.add_argument("--vision-latency", type=float, default=0.2, help="seconds per fake Vision batch")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency of up to this many seconds")
+    parser.add_argument("--work-dir", default=str(DEFAULT_WORK_DIR), help="where synthetic videos are cached")
+    parser.add_argument("--output", default=None, help="results JSON (default: <work-dir>/results.json)")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="results JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown before failing")
+    args = parser.parse_args()
+
+    cases = [case.strip() for case in args.cases.split(",") if case.strip()]
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+
+    results = run_benchmarks(
+        PROFILES[args.profile], cases, args.work_dir, args.repeat,
+        args.openai_latency, args.vision_latency, args.jitter,
+    )
+    output = Path(args.output or Path(args.work_dir) / 'results.json')
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {output}")
+
+    if args.save_baseline:
+        Path(args.baseline).write_text(json.dumps(results, indent=2))
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        # Baselines depend on the machine, so they are recorded where the benchmark runs
+        print(f"No baseline at {args.baseline}; record one with --save-baseline")
+        sys.exit(1)
+    regressions = compare_to_baseline(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+    if regressions:
+        print("Regressions against baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
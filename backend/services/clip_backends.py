@@ -0,0 +1,94 @@
+import torch
+from transformers import CLIPModel
+
+from telemetry import get_telemetry
+
+device = torch.device("cpu")
+
+# fp16 is kept for comparison only; most x86 CPUs emulate fp16 matmuls
+BACKENDS = ("fp32", "int8", "torchscript", "fp16")
+
+
+def configure_threads(num_threads: int | None = None, num_interop_threads: int | None = None):
+    """Set torch intra-op and inter-op thread counts; None leaves a setting alone."""
+
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError as e:
+            # Only allowed before the first parallel op in the process
+            get_telemetry().event("interop_threads_not_set", level="warning", error=str(e))
+
+
+class ClipBackend:
+    """A CLIP model prepared for one CPU inference backend."""
+
+    def __init__(self, name: str, model: CLIPModel, image_encoder=None):
+        self.name = name
+        self.model = model
+        self.dtype = next(model.parameters()).dtype if name != "int8" else torch.float32
+        self._image_encoder = image_encoder
+
+    @property
+    def logit_scale(self) -> torch.Tensor:
+        return self.model.logit_scale.exp().float()
+
+    def encode_text(self, inputs) -> torch.Tensor:
+        return self.model.get_text_features(**inputs).float()
+
+    def encode_images(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        pixel_values = pixel_values.to(device, self.dtype)
+        if self._image_encoder is not None:
+            return self._image_encoder(pixel_values).float()
+        return self.model.get_image_features(pixel_values=pixel_values).float()
+
+
+class _ImageFeatures(torch.nn.Module):
+    """Wraps get_image_features so it can be traced."""
+
+    def __init__(self, model: CLIPModel):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model.get_image_features(pixel_values=pixel_values)
+
+
+def load_backend(name: str, model_name: str) -> ClipBackend:
+    """
+    Load CLIP for the given backend.
+
+    fp32: plain float32 eager model.
+    int8: dynamic int8 quantization of every Linear layer.
+    torchscript: float32 image encoder traced, frozen and optimized for inference.
+    fp16: the original float16 configuration.
+    """
+
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown CLIP backend: {name}. Choose from {', '.join(BACKENDS)}")
+
+    if name == "fp16":
+        model = CLIPModel.from_pretrained(
+            model_name, torch_dtype=torch.float16, attn_implementation="sdpa"
+        )
+        return ClipBackend(name, model.to(device).eval())
+
+    if name == "torchscript":
+        model = CLIPModel.from_pretrained(
+            model_name, torch_dtype=torch.float32, attn_implementation="eager", torchscript=True
+        ).to(device).eval()
+        size = model.config.vision_config.image_size
+        example = torch.zeros(1, 3, size, size)
+        with torch.no_grad():
+            traced = torch.jit.trace(_ImageFeatures(model), example)
+            encoder = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+        return ClipBackend(name, model, image_encoder=encoder)
+
+    model = CLIPModel.from_pretrained(
+        model_name, torch_dtype=torch.float32, attn_implementation="sdpa"
+    ).to(device).eval()
+    if name == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return ClipBackend(name, model)
@@ -1,11 +1,39 @@
+import argparse
+import base64
+import io
 import time
+from functools import lru_cache
+from itertools import islice
+from pathlib import Path
 
 import cv2
 import torch
 from PIL import Image
-from transformers import CLIPModel, CLIPProcessor
+from transformers import CLIPProcessor
 
-device = torch.device("cpu")
+from clip_backends import BACKENDS, configure_threads, device, load_backend
+from media_source import MediaSource
+from telemetry import get_telemetry
+
+MODEL_NAME = "openai/clip-vit-base-patch32"
+
+DEFAULT_PROMPTS = (
+    "Officer taking gunpoint at bushes",
+    "Police officer",
+    "Gun",
+    "Incidence",
+    "Migrant",
+    "Shooting",
+    "Aggression",
+)
+
+# Prompts whose probability mass counts as relevance when picking key frames
+AGGRESSION_PROMPTS = (
+    "Officer taking gunpoint at bushes",
+    "Gun",
+    "Shooting",
+    "Aggression",
+)
 
 def rescale_frame(frame_input, percent: int = 50):
     """Downsample the frame dimensions by a specified percentage."""
@@ -17,8 +45,15 @@ def rescale_frame(frame_input, percent: int = 50):
     return cv2.resize(frame_input, dim, interpolation=cv2.INTER_AREA)
 
 
-def load_video(video_path: str) -> list[Image.Image]:
-    """Load a video, process frames, and return as list of PIL Images."""
+def to_pil(frame) -> Image.Image:
+    """Rescale a BGR frame and convert it to an RGB PIL Image."""
+
+    resized_frame = rescale_frame(frame)
+    return Image.fromarray(cv2.cvtColor(resized_frame, cv2.COLOR_BGR2RGB))
+
+
+def iter_video_frames(video_path: str, desired_fps: float = 1):
+    """Decode a video incrementally, yielding (timestamp, PIL Image) pairs."""
 
     cap = cv2.VideoCapture(video_path)
 
@@ -27,68 +62,362 @@ def load_video(video_path: str) -> list[Image.Image]:
 
     original_fps = cap.get(cv2.CAP_PROP_FPS)
     if original_fps <= 0:
-        print("Warning - FPS not correctly detected")
         original_fps = 30.0  # Default assumption if FPS unavailable
+        get_telemetry().event("fps_not_detected", level="warning", video=video_path, assumed_fps=original_fps)
 
-    desired_fps = 1
     frame_interval = 1.0 / desired_fps
     current_time = 0.0
-    frames = []
 
-    while True:
-        ret, frame = cap.read()
+    try:
+        while True:
+            ret, frame = cap.read()
 
-        if not ret:
-            break
+            if not ret:
+                break
 
-        # Calculate frame timing
-        frame_pos = cap.get(cv2.CAP_PROP_POS_FRAMES) - 1  # Current frame index
-        frame_time = frame_pos / original_fps
+            # Calculate frame timing
+            frame_pos = cap.get(cv2.CAP_PROP_POS_FRAMES) - 1  # Current frame index
+            frame_time = frame_pos / original_fps
 
-        if frame_time >= current_time:
-            resized_frame = rescale_frame(frame)
-            pil_image = Image.fromarray(cv2.cvtColor(resized_frame, cv2.COLOR_BGR2RGB))
-            frames.append(pil_image)
-            current_time += frame_interval
+            if frame_time >= current_time:
+                yield frame_time, to_pil(frame)
+                current_time += frame_interval
+    finally:
+        cap.release()
 
-    cap.release()
-    return frames
 
-model = CLIPModel.from_pretrained(
-    "openai/clip-vit-base-patch32",
-    torch_dtype=torch.float16,
-    attn_implementation="sdpa",
-)
-model = model.to(device)
+def load_video(video_path: str) -> list[Image.Image]:
+    """Load a video, process frames, and return as list of PIL Images."""
+
+    return [image for _, image in iter_video_frames(video_path)]
+
+
+def batched(iterable, size: int):
+    """Split an iterable into lists of at most size items."""
+
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def select_diverse_frames(
+    embeddings: torch.Tensor,
+    relevance: torch.Tensor,
+    budget: int,
+    similarity_threshold: float = 0.92,
+    mmr_lambda: float = 0.7,
+) -> list[int]:
+    """
+    Pick up to budget frames by maximal marginal relevance.
+
+    Each step takes the frame maximizing
+    mmr_lambda * relevance - (1 - mmr_lambda) * (max cosine similarity to the
+    frames already chosen). Frames more similar than similarity_threshold to a
+    chosen frame are never picked. Embeddings must be L2-normalized.
+
+    Returns the indices of the chosen frames in selection order.
+    """
+
+    count = embeddings.shape[0]
+    if count == 0 or budget < 1:
+        return []
+
+    similarity = embeddings @ embeddings.T
+    max_similarity = torch.full((count,), float("-inf"))
+    available = torch.ones(count, dtype=torch.bool)
+    chosen = []
+
+    while len(chosen) < budget and available.any():
+        redundancy = max_similarity.clamp(min=0) if chosen else torch.zeros(count)
+        mmr = mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+        mmr[~available] = float("-inf")
+        index = int(torch.argmax(mmr))
+        chosen.append(index)
+
+        max_similarity = torch.maximum(max_similarity, similarity[index])
+        available &= max_similarity <= similarity_threshold
+        available[index] = False
+
+    return chosen
+
+
+@lru_cache(maxsize=None)
+def load_clip(model_name: str = MODEL_NAME, backend: str = "fp32"):
+    """Load a CLIP backend and processor once per process, on first use."""
+
+    processor = CLIPProcessor.from_pretrained(model_name, device=device)
+    return load_backend(backend, model_name), processor
+
+
+class KeyFrameExtractor:
+    """
+    Scores video frames against text prompts with CLIP and keeps the best ones.
+
+    Frames are decoded and scored as a stream of fixed-size batches, so memory
+    stays bounded on long videos. The model is loaded on first use and the
+    prompt embeddings are computed once per extractor.
+
+    Key frames are chosen for diversity as well as relevance: near-duplicate
+    frames (cosine similarity above similarity_threshold) are collapsed as they
+    stream in, and the final frame_budget frames are picked from the remaining
+    candidates with maximal marginal relevance (see select_diverse_frames).
+
+    Frames are decoded by ffmpeg straight to RGB at decode_size pixels on
+    their shorter side (CLIP resizes its input to 224 anyway), so no
+    full-resolution frame is ever converted in Python. With thumbnail_size,
+    each key frame also carries a base64 JPEG of that size, so consumers can
+    use it without reading the saved file back.
 
-processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32", device=device)
+    backend selects the CPU inference path (see clip_backends.load_backend);
+    num_threads and num_interop_threads tune torch's thread pools.
+    """
+
+    def __init__(
+        self,
+        prompts: tuple[str, ...] = DEFAULT_PROMPTS,
+        batch_size: int = 16,
+        sample_fps: float = 1,
+        frame_budget: int = 8,
+        similarity_threshold: float = 0.92,
+        mmr_lambda: float = 0.7,
+        relevance_prompts: tuple[str, ...] = AGGRESSION_PROMPTS,
+        model_name: str = MODEL_NAME,
+        backend: str = "fp32",
+        num_threads: int | None = None,
+        num_interop_threads: int | None = None,
+        decode_size: int = 224,
+        thumbnail_size: tuple[int, int] | None = None,
+        thumbnail_quality: int = 50,
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown CLIP backend: {backend}. Choose from {', '.join(BACKENDS)}")
+        missing = set(relevance_prompts) - set(prompts)
+        if missing:
+            raise ValueError(f"Relevance prompts not in prompts: {', '.join(sorted(missing))}")
+        self.prompts = tuple(prompts)
+        self.batch_size = batch_size
+        self.sample_fps = sample_fps
+        self.frame_budget = frame_budget
+        self.similarity_threshold = similarity_threshold
+        self.mmr_lambda = mmr_lambda
+        self.relevance_index = torch.tensor(
+            [self.prompts.index(prompt) for prompt in relevance_prompts], dtype=torch.long
+        )
+        # Deduplicated candidates kept in memory before the final MMR pick
+        self.candidate_pool = 4 * frame_budget
+        self.model_name = model_name
+        self.backend_name = backend
+        self.decode_size = decode_size
+        self.thumbnail_size = thumbnail_size
+        self.thumbnail_quality = thumbnail_quality
+        self._text_embeddings = None
+        configure_threads(num_threads, num_interop_threads)
+
+    @property
+    def backend(self):
+        return load_clip(self.model_name, self.backend_name)[0]
+
+    @property
+    def processor(self):
+        return load_clip(self.model_name, self.backend_name)[1]
+
+    @torch.inference_mode()
+    def text_embeddings(self) -> torch.Tensor:
+        """Normalized prompt embeddings, computed on first call and reused."""
+
+        if self._text_embeddings is None:
+            inputs = self.processor(
+                text=list(self.prompts), return_tensors="pt", padding=True
+            ).to(device)
+            embeddings = self.backend.encode_text(inputs)
+            self._text_embeddings = embeddings / embeddings.norm(dim=-1, keepdim=True)
+        return self._text_embeddings
+
+    @torch.inference_mode()
+    def embed_images(self, images: list[Image.Image]) -> torch.Tensor:
+        """Normalized image embeddings for one batch."""
+
+        with get_telemetry().span("clip.embed_images", images=len(images), backend=self.backend_name):
+            pixel_values = self.processor(images=images, return_tensors="pt")["pixel_values"]
+            embeddings = self.backend.encode_images(pixel_values)
+            return embeddings / embeddings.norm(dim=-1, keepdim=True)
+
+    def score_frames(self, frames):
+        """
+        Score (timestamp, PIL Image) pairs batch by batch.
+
+        Yields one dict per frame with its timestamp, image, embedding, the
+        softmax probabilities over the prompts, the best prompt and score, and
+        the relevance (probability mass on the relevance prompts).
+        """
+
+        text_embeddings = self.text_embeddings()
+        logit_scale = self.backend.logit_scale
+
+        for batch in batched(frames, self.batch_size):
+            image_embeddings = self.embed_images([image for _, image in batch])
+            probs = torch.softmax(logit_scale * image_embeddings @ text_embeddings.T, -1)
+            best_probs, best_prompts = torch.max(probs, -1)
+
+            for i, (timestamp, image) in enumerate(batch):
+                yield {
+                    "timestamp": timestamp,
+                    "image": image,
+                    "embedding": image_embeddings[i],
+                    "probs": probs[i],
+                    "score": float(best_probs[i]),
+                    "label": self.prompts[int(best_prompts[i])],
+                    "relevance": float(probs[i, self.relevance_index].sum()),
+                }
+
+    def extract_key_frames(
+        self,
+        video_path: str,
+        source=None,
+        start: float | None = None,
+        end: float | None = None,
+    ) -> list[dict]:
+        """
+        Extract up to frame_budget relevant, mutually diverse frames and save
+        them as JPEGs.
+
+        When a MediaSource is given, frames in [start, end] are read from it
+        instead of decoding video_path; timestamps stay relative to start so
+        they match the trimmed clip.
+
+        Returns dicts with path, timestamp, score, label and relevance (and
+        thumbnail, with thumbnail_size), in time order.
+        """
+
+        frames = self._decoded_frames(video_path, source, start, end)
+        pool = []
+        for scored in self.score_frames(frames):
+            if pool:
+                similarity = torch.stack([c["embedding"] for c in pool]) @ scored["embedding"]
+                nearest = int(torch.argmax(similarity))
+                if similarity[nearest] > self.similarity_threshold:
+                    # Near-duplicate: keep whichever copy is more relevant
+                    if scored["relevance"] > pool[nearest]["relevance"]:
+                        pool[nearest] = scored
+                    continue
+            pool.append(scored)
+            if len(pool) > self.candidate_pool:
+                pool.remove(min(pool, key=lambda c: c["relevance"]))
+
+        chosen = []
+        if pool:
+            chosen = select_diverse_frames(
+                torch.stack([c["embedding"] for c in pool]),
+                torch.tensor([c["relevance"] for c in pool]),
+                self.frame_budget,
+                self.similarity_threshold,
+                self.mmr_lambda,
+            )
+
+        key_frames = []
+        stem = Path(video_path).with_suffix("")
+        for scored in sorted((pool[i] for i in chosen), key=lambda c: c["timestamp"]):
+            path = f"{stem}_frame_{scored['timestamp']:.2f}.jpg"
+            scored["image"].save(path, format="JPEG")
+            key_frame = {
+                "path": path,
+                "timestamp": scored["timestamp"],
+                "score": scored["score"],
+                "label": scored["label"],
+                "relevance": scored["relevance"],
+            }
+            if self.thumbnail_size:
+                key_frame["thumbnail"] = self._thumbnail(scored["image"])
+            key_frames.append(key_frame)
+        return key_frames
+
+    def _decoded_frames(self, video_path: str, source, start: float | None, end: float | None):
+        """Yield (timestamp, PIL Image) pairs decoded at decode_size."""
+
+        if source is None:
+            with MediaSource(video_path) as source:
+                yield from self._decoded_frames(video_path, source, start, end)
+            return
+
+        start = start or 0.0
+        end = source.duration if end is None else end
+        size = source.scaled_size(shorter_side=self.decode_size)
+        for timestamp, frame in source.frames_between(start, end, self.sample_fps, size, "rgb24"):
+            yield timestamp - start, Image.fromarray(frame)
+
+    def _thumbnail(self, image: Image.Image) -> str:
+        """Base64 JPEG of an image resized to thumbnail_size."""
+
+        buffer = io.BytesIO()
+        image.resize(self.thumbnail_size).save(buffer, format="JPEG", quality=self.thumbnail_quality)
+        return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def compare_backends(
+    images: list[Image.Image],
+    backends: tuple[str, ...] = BACKENDS,
+    reference: str = "fp32",
+    batch_size: int = 16,
+    repeats: int = 3,
+) -> dict[str, dict]:
+    """
+    Benchmark CLIP backends on the same images.
+
+    Reports images/sec (best of repeats, after a warm-up batch), the largest
+    absolute difference in prompt probabilities against the reference backend
+    and the fraction of images whose best prompt agrees with it.
+    """
+
+    frames = [(float(i), image) for i, image in enumerate(images)]
+    probs = {}
+    report = {}
+    for name in dict.fromkeys((reference, *backends)):
+        extractor = KeyFrameExtractor(batch_size=batch_size, backend=name)
+        list(extractor.score_frames(frames[:batch_size]))  # load and warm up
+
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            scored = list(extractor.score_frames(frames))
+            best = min(best, time.perf_counter() - start)
+
+        probs[name] = torch.stack([entry["probs"] for entry in scored])
+        report[name] = {"images_per_sec": len(frames) / best}
+
+    for name, result in report.items():
+        diff = (probs[name] - probs[reference]).abs()
+        agreement = probs[name].argmax(-1) == probs[reference].argmax(-1)
+        result["max_abs_diff"] = float(diff.max()) if diff.numel() else 0.0
+        result["top1_agreement"] = float(agreement.float().mean()) if agreement.numel() else 1.0
+    return report
 
 
 if __name__ == '__main__':
-    frames = load_video("police_encounter.mp4")
+    parser = argparse.ArgumentParser(description="Extract CLIP key frames from a video.")
+    parser.add_argument("video", nargs="?", default="police_encounter.mp4")
+    parser.add_argument("--backend", choices=BACKENDS, default="fp32")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--compare-backends", action="store_true",
+                        help="benchmark every backend on the video's frames and exit")
+    args = parser.parse_args()
+
+    if args.compare_backends:
+        configure_threads(args.threads)
+        for name, result in compare_backends(load_video(args.video)).items():
+            print(
+                f"{name:>12}: {result['images_per_sec']:.1f} images/sec, "
+                f"max prob diff {result['max_abs_diff']:.4f}, "
+                f"top-1 agreement {result['top1_agreement']:.0%}"
+            )
+        raise SystemExit(0)
+
+    extractor = KeyFrameExtractor(backend=args.backend, num_threads=args.threads)
     print("Processing - this may take a while...")
 
     start = time.time()
 
-    inputs = processor(
-        text=[
-            "Officer taking gunpoint at bushes",
-            "Police officer",
-            "Gun",
-            "Incidence",
-            "Migrant",
-            "Shooting",
-            "Aggression",
-        ],
-        images=frames,
-        return_tensors="pt",
-        padding=True,
-    ).to(device)
-
-    output = model(**inputs)
+    key_frames = extractor.extract_key_frames(args.video)
 
     print("Time Taken:", time.time() - start)
 
-    probs = torch.max(torch.softmax(output["logits_per_image"], -1), -1)
-
-    print(f"The frames with the higest probs for prompts: {probs}")
+    print(f"The frames with the higest probs for prompts: {key_frames}")
@@ -0,0 +1,315 @@
+import argparse
+import os
+import time
+from collections import deque
+from typing import NamedTuple
+
+import ffmpeg
+import numpy as np
+
+from motion_filter import MotionScorer
+from telemetry import configure_from_env, get_telemetry
+from vad import detect_speech, pcm_to_samples
+from wav_buffer import wav_header
+
+LIVE_SAMPLE_RATE = 16000
+
+
+class KeyMoment(NamedTuple):
+    """A burst of activity: its peak time and score and the span it covered."""
+
+    timestamp: float
+    score: float
+    start: float
+    end: float
+    speech: bool
+
+
+class LiveUpdate(NamedTuple):
+    """What one LiveMonitor.update() call processed and found."""
+
+    moments: list[KeyMoment]
+    transcripts: list[dict]
+    video_time: float
+    audio_time: float
+
+
+class LiveMonitor:
+    """
+    Incremental key moment detection for a recording that is still being written.
+
+    Each update() decodes only what was appended since the previous call:
+    video as small grayscale thumbnails at sample_fps, and audio as 16 kHz mono
+    PCM read in bounded pieces. Motion energy (weighted up during speech found
+    by the local VAD) is averaged over a sliding window of window seconds. A
+    key moment starts when the window score exceeds both min_score and
+    threshold times the median score of the last history seconds. It is
+    emitted at its peak once activity falls back, or after max_episode
+    seconds. Only history seconds of scores are kept, so memory stays bounded
+    however long the shift runs.
+
+    The file must be readable while it grows, e.g. fragmented MP4, MPEG-TS or
+    Matroska as written by most recorders; a plain MP4 has no index until it
+    is closed.
+    """
+
+    def __init__(
+        self,
+        video_path: str,
+        on_moment=None,
+        analyzer=None,
+        sample_fps: float = 2.0,
+        window: float = 10.0,
+        history: float = 300.0,
+        threshold: float = 2.0,
+        min_score: float = 1.0,
+        speech_boost: float = 0.5,
+        cooldown: float = 25.0,
+        max_episode: float = 25.0,
+        thumbnail_width: int = 64,
+        max_audio_read: float = 120.0,
+    ):
+        """
+        Args:
+            video_path: The growing recording.
+            on_moment: Called with each KeyMoment as soon as it is emitted.
+            analyzer: An AudioAnalyzer; when given, speech in new audio is
+                transcribed with analyze_speech_timeline.
+            sample_fps: Thumbnails scored per second of video.
+            window: Seconds averaged into each activity score.
+            history: Seconds of scores kept for the adaptive baseline.
+            threshold: Multiple of the baseline a window must exceed.
+            min_score: Absolute floor a window must exceed.
+            speech_boost: Extra motion weight for samples during speech.
+            cooldown: Seconds after a moment's peak before another can start.
+            max_episode: Longest episode before it is emitted without ending.
+            thumbnail_width: Width of the motion thumbnails in pixels.
+            max_audio_read: Longest piece of audio decoded at once, in seconds.
+        """
+        self.video_path = video_path
+        self.on_moment = on_moment
+        self.analyzer = analyzer
+        self.sample_fps = sample_fps
+        self.window = window
+        self.history = history
+        self.threshold = threshold
+        self.min_score = min_score
+        self.speech_boost = speech_boost
+        self.cooldown = cooldown
+        self.max_episode = max_episode
+        self.max_audio_read = max_audio_read
+        self.motion_scorer = MotionScorer(thumbnail_width)
+
+        self.video_time = 0.0  # next unprocessed video time
+        self.audio_time = 0.0  # next unprocessed audio time
+        self.has_audio = None
+        self._thumbnail_size = None
+        self._previous = None
+        self._window = deque()  # (timestamp, weighted energy) inside the window
+        self._window_sum = 0.0
+        self._scores = deque()  # (timestamp, window score) inside history
+        self._speech = deque()  # (start, end) speech regions inside history
+        self._episode = None  # [start, peak time, peak score, speech at peak]
+        self._last_peak = None
+
+    @property
+    def scores(self) -> list[tuple[float, float]]:
+        """The (timestamp, window score) pairs of the last history seconds."""
+        return list(self._scores)
+
+    def update(self) -> LiveUpdate:
+        """Processes everything appended since the last call."""
+        with get_telemetry().span("live.update", video=self.video_path) as span:
+            if self._thumbnail_size is None:
+                self._probe()
+            transcripts = self._process_audio() if self.has_audio else []
+            moments = self._process_video()
+            span.set(video_time=self.video_time, audio_time=self.audio_time, moments=len(moments))
+        return LiveUpdate(moments, transcripts, self.video_time, self.audio_time)
+
+    def finish(self) -> list[KeyMoment]:
+        """Emits the episode still in progress once the recording has ended."""
+        if self._episode is None:
+            return []
+        return [self._emit(self.video_time)]
+
+    def run(self, poll_interval: float = 5.0, idle_timeout: float = 60.0):
+        """
+        Calls update() whenever the file grows and yields each LiveUpdate,
+        stopping once it has not grown for idle_timeout seconds.
+        """
+        idle_since = time.monotonic()
+        last_size = None
+        while True:
+            size = os.path.getsize(self.video_path)
+            if size != last_size:
+                last_size = size
+                idle_since = time.monotonic()
+                yield self.update()
+            elif time.monotonic() - idle_since >= idle_timeout:
+                break
+            time.sleep(poll_interval)
+        moments = self.finish()
+        if moments:
+            yield LiveUpdate(moments, [], self.video_time, self.audio_time)
+
+    def _probe(self):
+        probe = ffmpeg.probe(self.video_path)
+        video_stream = next(s for s in probe["streams"] if s.get("codec_type") == "video")
+        self.has_audio = any(s.get("codec_type") == "audio" for s in probe["streams"])
+        width = self.motion_scorer.width
+        height = int(video_stream["height"]) * width / int(video_stream["width"])
+        self._thumbnail_size = (width, max(2, int(round(height / 2)) * 2))
+
+    def _process_video(self) -> list[KeyMoment]:
+        width, height = self._thumbnail_size
+        frame_bytes = width * height
+        process = (
+            ffmpeg.input(self.video_path, ss=self.video_time)
+            .filter("fps", fps=self.sample_fps)
+            .filter("scale", width, height)
+            .output("pipe:", format="rawvideo", pix_fmt="gray")
+            .global_args("-loglevel", "quiet")
+            .run_async(pipe_stdout=True)
+        )
+
+        moments = []
+        decoded = 0
+        try:
+            while True:
+                data = process.stdout.read(frame_bytes)
+                if len(data) < frame_bytes:
+                    break
+                thumbnail = np.frombuffer(data, dtype=np.uint8).reshape(height, width).astype(np.float32)
+                timestamp = self.video_time
+                self.video_time += 1 / self.sample_fps
+                decoded += 1
+
+                energy = float(self.motion_scorer.energies([thumbnail], self._previous)[-1])
+                self._previous = thumbnail
+                if self._in_speech(timestamp):
+                    energy *= 1 + self.speech_boost
+                moment = self._add_sample(timestamp, energy)
+                if moment is not None:
+                    moments.append(moment)
+        finally:
+            process.stdout.close()
+            process.wait()
+
+        get_telemetry().count("frames_decoded_total", decoded, mode="live")
+        return moments
+
+    def _process_audio(self) -> list[dict]:
+        """
+        Reads new audio in pieces of at most max_audio_read seconds and runs
+        the VAD on it. Speech still running at the end of the available audio
+        is left for the next update so it is never cut mid-sentence.
+        """
+        transcripts = []
+        while True:
+            # The tail of a growing file may be cut mid-packet, so ffmpeg's exit
+            # status is ignored and whatever it decoded is used
+            process = (
+                ffmpeg.input(self.video_path, ss=self.audio_time, t=self.max_audio_read)
+                .output("pipe:", format="s16le", acodec="pcm_s16le", ac=1, ar=LIVE_SAMPLE_RATE)
+                .global_args("-loglevel", "quiet")
+                .run_async(pipe_stdout=True)
+            )
+            pcm, _ = process.communicate()
+            available = len(pcm) / (2 * LIVE_SAMPLE_RATE)
+            if available <= 0:
+                break
+
+            segments = detect_speech(pcm_to_samples(pcm), LIVE_SAMPLE_RATE)
+            processed = available
+            if segments and available - segments[-1][1] < 0.5 and segments[-1][0] > 0:
+                # Speech runs into the end of the file; finish it next update
+                processed = segments[-1][0]
+                segments = segments[:-1]
+            if processed <= 0:
+                break
+
+            for start, end in segments:
+                self._speech.append((self.audio_time + start, self.audio_time + end))
+            if self.analyzer is not None and segments:
+                used = pcm[:int(processed * LIVE_SAMPLE_RATE) * 2]
+                wav = wav_header(len(used), LIVE_SAMPLE_RATE, 1, 2) + used
+                transcripts.extend(self.analyzer.analyze_speech_timeline(wav, offset=self.audio_time))
+
+            self.audio_time += processed
+            if available < self.max_audio_read:
+                break
+        return transcripts
+
+    def _in_speech(self, timestamp: float) -> bool:
+        return any(start <= timestamp < end for start, end in self._speech)
+
+    def _add_sample(self, timestamp: float, energy: float) -> KeyMoment | None:
+        self._window.append((timestamp, energy))
+        self._window_sum += energy
+        while self._window[0][0] <= timestamp - self.window:
+            self._window_sum -= self._window.popleft()[1]
+        score = self._window_sum / len(self._window)
+
+        self._scores.append((timestamp, score))
+        while self._scores[0][0] <= timestamp - self.history:
+            self._scores.popleft()
+        while self._speech and self._speech[0][1] <= timestamp - self.history:
+            self._speech.popleft()
+
+        baseline = float(np.median([s for _, s in self._scores]))
+        active = score > self.min_score and score > self.threshold * baseline
+
+        if self._episode is None:
+            cooling = self._last_peak is not None and timestamp - self._last_peak < self.cooldown
+            if active and not cooling:
+                self._episode = [timestamp, timestamp, score, self._in_speech(timestamp)]
+            return None
+
+        if active and score > self._episode[2]:
+            self._episode[1:] = [timestamp, score, self._in_speech(timestamp)]
+        if not active or timestamp - self._episode[0] >= self.max_episode:
+            return self._emit(timestamp)
+        return None
+
+    def _emit(self, end: float) -> KeyMoment:
+        start, peak, score, speech = self._episode
+        self._episode = None
+        self._last_peak = peak
+        moment = KeyMoment(peak, score, start, end, speech)
+        get_telemetry().event("live_key_moment", **moment._asdict())
+        if self.on_moment is not None:
+            self.on_moment(moment)
+        return moment
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch a growing recording and report key moments as they happen.")
+    parser.add_argument("video_path")
+    parser.add_argument("--poll", type=float, default=5.0, help="seconds between checks for new data")
+    parser.add_argument("--idle-timeout", type=float, default=60.0, help="stop after the file stops growing this long")
+    parser.add_argument("--transcribe", action="store_true", help="transcribe new speech with the OpenAI API")
+    args = parser.parse_args()
+
+    configure_from_env()
+    analyzer = None
+    if args.transcribe:
+        from dotenv import load_dotenv
+        from openai import OpenAI
+        from subtitle_generator import AudioAnalyzer
+        load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+        analyzer = AudioAnalyzer(OpenAI(api_key=os.getenv("OPENAI_API_KEY")))
+
+    monitor = LiveMonitor(args.video_path, analyzer=analyzer)
+    for update in monitor.run(args.poll, args.idle_timeout):
+        for moment in update.moments:
+            print(
+                f"Key moment at {moment.timestamp:.1f}s ({moment.start:.1f}-{moment.end:.1f}s) "
+                f"- Activity Score: {moment.score:.1f}{' with speech' if moment.speech else ''}"
+            )
+        for entry in update.transcripts:
+            print(f"[{entry['start']:.1f}-{entry['end']:.1f}s] {entry['transcript']}")
+
+
+if __name__ == "__main__":
+    main()
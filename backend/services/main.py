@@ -1,104 +1,354 @@
 import os
-import cv2
+import json
 import base64
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from dotenv import load_dotenv
-from action_detector import ActionDetector
+from action_detector import ActionDetector, VISION_CACHE_MODEL, VISION_CACHE_PROMPT
+from artifact_store import ArtifactStore, artifact_key, file_paths, fingerprint_file
 from video_trimmer import VideoTrimmer
-from subtitle_generator import SubtitleGenerator
+from subtitle_generator import SubtitleGenerator, AUDIO_MODEL, AUDIO_PROMPT
 from frame_extractor import KeyFrameExtractor
+from media_source import MediaSource
+from request_engine import RequestEngine, estimate_tokens, record_usage
+from response_cache import ResponseCache
+from telemetry import configure_from_env, get_telemetry
 from openai import OpenAI
 
+ANALYSIS_MODEL = "gpt-3.5-turbo"
+FRAME_SYSTEM_PROMPT = "You are analyzing bodycam footage. Focus on assessing the level of aggression and concerning behavior in the scene."
+FRAME_PROMPT = "This is a frame from a bodycam video. {time_desc}. Focus ONLY on assessing the level of aggression and concerning behavior in this specific frame. Be concise.{context}\n\nImage: data:image/jpeg;base64,{image}"
+SUMMARY_SYSTEM_PROMPT = "You are summarizing a sequence of bodycam footage analyses."
+SUMMARY_PROMPT = "Based on these frame analyses, provide a BRIEF summary of how the level of aggression progresses. Focus on changes in behavior and tension:\n\n{analyses}"
+
+# Bump to invalidate every stored stage artifact, e.g. after changing a stage's code
+ARTIFACT_VERSION = 3
+
+def _settings(component):
+    # The plain-valued attributes of a component, used as stage parameters
+    return {
+        name: value for name, value in vars(component).items()
+        if not name.startswith('_') and isinstance(value, (str, int, float, bool, tuple, type(None)))
+    }
+
 class BodycamAnalysisWorkflow:
-    def __init__(self):
+    def __init__(self, frame_budget=8, openai_client=None, vision_client=None, max_clips=3, api_clients=True):
+        # frame_budget caps how many key frames are sent to the LLM per clip.
+        # max_clips is how many non-overlapping key moments are analyzed.
+        # openai_client/vision_client replace the real clients, e.g. with local stubs.
+        # api_clients=False skips the API clients and the response cache, for worker
+        # processes that only run LOCAL_STAGES.
         load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
-        google_cloud_key = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'config/hackathon-key-7e5ce787d8e4.json')
-        self.action_detector = ActionDetector(google_cloud_key)
+        self.client = self.request_engine = self.response_cache = None
+        self.action_detector = self.subtitle_generator = None
+        if api_clients:
+            google_cloud_key = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'config/hackathon-key-7e5ce787d8e4.json')
+            self.client = openai_client or OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+            self.request_engine = RequestEngine(max_concurrency=8, requests_per_minute=500)
+            # RESPONSE_CACHE_READ_ONLY=1 replays stored responses without writing new ones
+            self.response_cache = ResponseCache(
+                os.getenv('RESPONSE_CACHE_PATH') or os.path.join(os.path.dirname(__file__), '.cache', 'responses.sqlite3'),
+                read_only=os.getenv('RESPONSE_CACHE_READ_ONLY') == '1'
+            )
+            self.action_detector = ActionDetector(google_cloud_key, cache=self.response_cache, client=vision_client)
+            self.subtitle_generator = SubtitleGenerator(self.client, self.request_engine, self.response_cache)
         self.video_trimmer = VideoTrimmer(os.getenv('OPENAI_API_KEY'))
-        self.subtitle_generator = SubtitleGenerator(google_cloud_key)
-        self.frame_extractor = KeyFrameExtractor(google_cloud_key)
-        self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        # Key frames carry the 224x224 JPEG the LLM is sent, so analysis never re-reads them
+        self.frame_extractor = KeyFrameExtractor(frame_budget=frame_budget, thumbnail_size=(224, 224))
+        self.max_clips = max_clips
+        self.clip_duration = 25
+        # Stage outputs are checkpointed so only stages whose inputs changed rerun;
+        # ARTIFACT_STORE=off disables it
+        self.artifacts = None
+        if os.getenv('ARTIFACT_STORE', 'on').lower() not in ('off', '0', 'false', 'no'):
+            self.artifacts = ArtifactStore(
+                os.getenv('ARTIFACT_STORE_PATH') or os.path.join(os.path.dirname(__file__), '.cache', 'artifacts')
+            )
 
-    def analyze_footage(self, video_path):
-        print("Detecting key moment...")
-        key_moments = self.action_detector.detect_key_moment(video_path)
-        if not key_moments:
-            print("No significant moments detected")
+    # Stages of analyze_footage in order. Each stage reads the JSON-serializable
+    # state built by earlier stages and returns the keys it adds.
+    STAGES = ('detect', 'trim', 'transcribe', 'frames', 'analyze')
+    # The stages that only work on local files and never call an API
+    LOCAL_STAGES = ('trim', 'frames')
+
+    # The stages whose outputs each stage reads; a stage's artifact key covers theirs,
+    # so changing one stage's parameters invalidates it and everything downstream
+    STAGE_DEPENDENCIES = {
+        'detect': (),
+        'trim': ('detect',),
+        'transcribe': ('trim',),
+        'frames': ('trim',),
+        'analyze': ('transcribe', 'frames'),
+    }
+
+    def analyze_footage(self, video_path, progress=None):
+        # progress, if given, is called as progress(stage, 'started' | 'done')
+        telemetry = get_telemetry()
+        state = {}
+        try:
+            with telemetry.span('analyze_footage', video=video_path), ExitStack() as stack:
+                # Every stage reads from one probed, shared source instead of reopening the file.
+                # It is only opened once a stage actually has to run.
+                source = None
+                for stage in self.STAGES:
+                    if progress:
+                        progress(stage, 'started')
+                    if source is None and stage != 'analyze' and not self._is_stored(stage, video_path, state):
+                        source = stack.enter_context(MediaSource(video_path))
+                    state.update(self.run_stage(stage, video_path, state, source))
+                    if progress:
+                        progress(stage, 'done')
+                    if state.get('key_timestamp') is None:
+                        return None
+            return self.build_result(state)
+        finally:
+            telemetry.flush()
+
+    def run_stage(self, stage, video_path, state, source=None):
+        """
+        Runs one stage of analyze_footage and returns the state it adds.
+        Without a shared MediaSource, stages that read the video open their own.
+        A stage whose inputs and parameters match a stored artifact is not run;
+        the stored state is returned instead.
+        """
+        if stage not in self.STAGES:
+            raise ValueError(f"Unknown stage: {stage}")
+        with get_telemetry().span(f'stage.{stage}', video=video_path) as span:
+            key = self.stage_key(stage, video_path, state) if self.artifacts else None
+            if key:
+                stored = self.artifacts.load(key)
+                if stored is not None:
+                    span.set(cached=True)
+                    return stored
+            if source is None and stage != 'analyze':
+                with MediaSource(video_path) as source:
+                    update = getattr(self, f'_stage_{stage}')(video_path, state, source)
+            else:
+                update = getattr(self, f'_stage_{stage}')(video_path, state, source)
+            if key:
+                update = {**update, f'{stage}_artifact': key}
+                # Clips carry the paths of earlier stages' files along; store only this stage's
+                inherited = set(file_paths(state))
+                created = [path for path in dict.fromkeys(file_paths(update)) if path not in inherited]
+                self.artifacts.save(key, stage, update, created)
+            return update
+
+    def stage_params(self, stage):
+        # Everything besides the upstream state that determines a stage's output
+        if stage == 'detect':
+            return {
+                'max_clips': self.max_clips,
+                'clip_duration': self.clip_duration,
+                'vision_model': VISION_CACHE_MODEL,
+                'vision_prompt': VISION_CACHE_PROMPT,
+                'detector': _settings(self.action_detector),
+            }
+        if stage == 'transcribe':
+            return {
+                'model': AUDIO_MODEL,
+                'prompt': AUDIO_PROMPT,
+                'analyzer': _settings(self.subtitle_generator.audio_analyzer),
+            }
+        if stage == 'frames':
+            return {
+                'extractor': _settings(self.frame_extractor),
+                'relevance_index': self.frame_extractor.relevance_index.tolist(),
+            }
+        if stage == 'analyze':
+            return {
+                'model': ANALYSIS_MODEL,
+                'prompts': [FRAME_SYSTEM_PROMPT, FRAME_PROMPT, SUMMARY_SYSTEM_PROMPT, SUMMARY_PROMPT],
+            }
+        return {}
+
+    def stage_key(self, stage, video_path, state):
+        # Hash of the video's content, the stage's parameters and the keys of the
+        # stages it depends on; None if a dependency was not checkpointed
+        upstream = [state.get(f'{dependency}_artifact') for dependency in self.STAGE_DEPENDENCIES[stage]]
+        if None in upstream:
             return None
-        key_timestamp, highest_score = key_moments[0]
-        print("Trimming video around most significant moment...")
-        trimmed_video = self.video_trimmer.trim_video(video_path, key_timestamp)
-        print("Extracting text from video...")
-        transcript_path, transcript = self.subtitle_generator.extract_text(trimmed_video)
-        print("Extracting and analyzing key frames...")
-        frame_data = self.frame_extractor.extract_key_frames(trimmed_video)
-        print("Analyzing protocol compliance...")
-        analysis = self._analyze_protocol(frame_data, transcript)
+        return artifact_key(
+            ARTIFACT_VERSION, stage, self.stage_params(stage),
+            os.path.abspath(video_path), fingerprint_file(video_path), upstream
+        )
+
+    def _is_stored(self, stage, video_path, state):
+        if not self.artifacts:
+            return False
+        key = self.stage_key(stage, video_path, state)
+        return key is not None and self.artifacts.contains(key)
+
+    def build_result(self, state):
+        # Top-level keys describe the highest-ranked clip; 'clips' has every clip in rank order
+        clips = [
+            {
+                'timestamp': clip['timestamp'],
+                'score': clip['score'],
+                'start': clip['start'],
+                'end': clip['end'],
+                'trimmed_video': clip['trimmed_video'],
+                'transcript_path': clip['transcript_path'],
+                'key_frames': [frame['path'] for frame in clip['frame_data']],
+                'frame_timestamps': [frame['timestamp'] for frame in clip['frame_data']],
+                'transcript': clip['transcript'],
+                'analysis': clip['analysis']
+            }
+            for clip in state['clips']
+        ]
+        best = clips[0]
         return {
-            'trimmed_video': trimmed_video,
-            'transcript_path': transcript_path,
-            'key_frames': [frame['path'] for frame in frame_data],
-            'frame_timestamps': [frame['timestamp'] for frame in frame_data],
-            'transcript': transcript,
-            'analysis': analysis
+            'trimmed_video': best['trimmed_video'],
+            'transcript_path': best['transcript_path'],
+            'key_frames': best['key_frames'],
+            'frame_timestamps': best['frame_timestamps'],
+            'transcript': best['transcript'],
+            'analysis': best['analysis'],
+            'clips': clips
         }
 
-    def _analyze_protocol(self, frame_data, transcript):
-        frame_analyses = []
+    def _stage_detect(self, video_path, state, source):
+        key_moments = self.action_detector.top_moments(source, k=self.max_clips, window=self.clip_duration)
+        if not key_moments:
+            get_telemetry().event('no_key_moment', video=video_path)
+            return {'key_timestamp': None}
+        clips = []
+        for timestamp, score in key_moments:
+            start, end = self.video_trimmer.clip_window(timestamp, source.duration, self.clip_duration)
+            clips.append({'timestamp': timestamp, 'score': score, 'start': start, 'end': end})
+        return {'key_timestamp': clips[0]['timestamp'], 'highest_score': clips[0]['score'], 'clips': clips}
+
+    def _stage_trim(self, video_path, state, source):
+        # All clips are cut in one stream-copy pass over the input. The cuts are widened
+        # to keyframes, so start/end become the bounds the clip really covers; transcript
+        # and frame timestamps are measured from them and line up with trimmed_video.
+        clips = state['clips']
+        trimmed = self.video_trimmer.trim_ranges(video_path, [(clip['start'], clip['end']) for clip in clips])
+        return {'clips': [
+            {**clip, 'trimmed_video': path, 'start': start, 'end': end}
+            for clip, (path, start, end) in zip(clips, trimmed)
+        ]}
+
+    def _stage_transcribe(self, video_path, state, source):
+        clips = state['clips']
+
+        def transcribe(clip):
+            return self.subtitle_generator.extract_text(
+                clip['trimmed_video'], source=source, start=clip['start'], end=clip['end']
+            )
+
+        # Transcription waits on the API, so the clips are transcribed concurrently
+        with ThreadPoolExecutor(max_workers=len(clips)) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, transcribe, clip) for clip in clips]
+            results = [future.result() for future in futures]
+        return {'clips': [
+            {**clip, 'transcript_path': transcript_path, 'transcript': transcript}
+            for clip, (transcript_path, transcript) in zip(clips, results)
+        ]}
+
+    def _stage_frames(self, video_path, state, source):
+        # Each clip's frames are decoded by an ffmpeg process that seeks straight to it
+        return {'clips': [
+            {**clip, 'frame_data': self.frame_extractor.extract_key_frames(
+                clip['trimmed_video'], source=source, start=clip['start'], end=clip['end']
+            )}
+            for clip in state['clips']
+        ]}
+
+    def _stage_analyze(self, video_path, state, source):
+        clips = state['clips']
+        with get_telemetry().span('analyze_protocol', clips=len(clips)):
+            analyses = self.request_engine.run(self._analyze_clips_async(clips))
+        return {'clips': [{**clip, 'analysis': analysis} for clip, analysis in zip(clips, analyses)]}
+
+    async def _analyze_clips_async(self, clips):
+        # Every clip's frame and summary requests share the engine's concurrency limit
+        return await asyncio.gather(*(
+            self._analyze_protocol_async(clip['frame_data'], clip['transcript']) for clip in clips
+        ))
+
+    async def _analyze_protocol_async(self, frame_data, transcript):
+        # Frame analyses are independent, so they run concurrently through the engine
+        telemetry = get_telemetry()
         context = "" # Suneet
         if transcript and transcript != "No audio content detected in the video.":
             context = f"\n\nContext - Audio transcript: {transcript}"
+        descriptions = []
+        calls = []
         for i, frame in enumerate(frame_data):
             time_desc = f"Frame {i+1} (at {frame['timestamp']:.2f}s)"
-            try:
-                img = cv2.imread(frame['path'])
-                resized = cv2.resize(img, (224, 224))
-                _, buffer = cv2.imencode('.jpg', resized, [cv2.IMWRITE_JPEG_QUALITY, 50])
-                encoded = base64.b64encode(buffer).decode('utf-8')
-                messages = [
-                    {"role": "system", "content": "You are analyzing bodycam footage. Focus on assessing the level of aggression and concerning behavior in the scene."},
-                    {"role": "user", "content": f"This is a frame from a bodycam video. {time_desc}. Focus ONLY on assessing the level of aggression and concerning behavior in this specific frame. Be concise.{context}\n\nImage: data:image/jpeg;base64,{encoded}"}
-                ]
-                response = self.client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=messages,
-                    max_tokens=100
-                )
-                if response.choices[0].message.content:
-                    frame_analyses.append(f"{time_desc}: {response.choices[0].message.content.strip()}")
-                    print(f"Analyzed {time_desc}")
-                else:
-                    raise Exception("Empty response from model")
-            except Exception as e:
-                print(f"Error analyzing {time_desc}: {str(e)}")
+            descriptions.append(time_desc)
+            calls.append(self._analyze_frame(frame, time_desc, context))
+        frame_analyses = []
+        for time_desc, result in zip(descriptions, await self.request_engine.gather(calls)):
+            if isinstance(result, Exception):
+                telemetry.event('frame_analysis_failed', level='error', frame=time_desc, error=str(result))
                 frame_analyses.append(f"{time_desc}: Analysis failed")
+            else:
+                frame_analyses.append(f"{time_desc}: {result}")
+                telemetry.event('frame_analyzed', frame=time_desc)
         try:
             summary_messages = [
-                {"role": "system", "content": "You are summarizing a sequence of bodycam footage analyses."},
-                {"role": "user", "content": "Based on these frame analyses, provide a BRIEF summary of how the level of aggression progresses. Focus on changes in behavior and tension:\n\n" + "\n\n".join(frame_analyses)}
+                {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                {"role": "user", "content": SUMMARY_PROMPT.format(analyses="\n\n".join(frame_analyses))}
             ]
-            summary_response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=summary_messages,
-                max_tokens=200
-            )
-            if not summary_response.choices[0].message.content:
+            summary = await self._complete(summary_messages, 200)
+            if not summary:
                 return "Analysis failed: No summary generated"
-            return summary_response.choices[0].message.content.strip()
+            return summary
         except Exception as e:
-            print(f"Error generating summary: {str(e)}")
+            telemetry.event('summary_failed', level='error', error=str(e))
             return "Analysis failed: Could not generate summary"
 
+    async def _analyze_frame(self, frame, time_desc, context):
+        encoded = frame['thumbnail']
+        messages = [
+            {"role": "system", "content": FRAME_SYSTEM_PROMPT},
+            {"role": "user", "content": FRAME_PROMPT.format(time_desc=time_desc, context=context, image=encoded)}
+        ]
+        content = await self._complete(messages, 100, payload=base64.b64decode(encoded))
+        if not content:
+            raise Exception("Empty response from model")
+        return content
+
+    async def _complete(self, messages, max_tokens, payload=b"", model=ANALYSIS_MODEL):
+        # Cached on the encoded image, model and full prompt; empty replies are not cached
+        prompt = json.dumps({"messages": messages, "max_tokens": max_tokens}, sort_keys=True)
+        cache_key = ResponseCache.make_key(payload, model, prompt)
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        telemetry = get_telemetry()
+        telemetry.count('bytes_uploaded_total', len(prompt), api='openai')
+        response = await self.request_engine.call(
+            self.client.chat.completions.create,
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            tokens=estimate_tokens(messages, max_tokens)
+        )
+        record_usage(response, model)
+        content = (response.choices[0].message.content or "").strip()
+        if content:
+            self.response_cache.put(cache_key, content)
+        return content
+
 def main():
+    configure_from_env()
     workflow = BodycamAnalysisWorkflow()
     video_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "video_trimmed.mp4")
     if os.path.exists(video_path):
         results = workflow.analyze_footage(video_path)
         print("\nAnalysis Results:")
-        print(results['analysis'])
-        for frame_path in results['key_frames']:
-            if os.path.exists(frame_path):
-                os.remove(frame_path)
-                print(f"Cleaned up temporary file: {frame_path}")
+        for clip in results['clips']:
+            print(f"\n{clip['start']:.1f}s - {clip['end']:.1f}s (Activity Score: {clip['score']:.1f})")
+            print(clip['analysis'])
+        for clip in results['clips']:
+            for frame_path in clip['key_frames']:
+                if os.path.exists(frame_path):
+                    os.remove(frame_path)
+                    print(f"Cleaned up temporary file: {frame_path}")
     else:
         print(f"Error: Video file not found at {video_path}")
 
@@ -0,0 +1,330 @@
+from collections import OrderedDict
+from fractions import Fraction
+from pathlib import Path
+
+import cv2
+import ffmpeg
+import numpy as np
+
+from telemetry import get_telemetry
+
+# Bytes per pixel of the raw formats decode_frames can produce
+PIXEL_CHANNELS = {"gray": 1, "bgr24": 3, "rgb24": 3}
+# Largest relative gap between the nominal and average frame rate of a constant-rate stream
+CFR_TOLERANCE = 0.001
+
+
+def probe_keyframes(
+    video_path: str,
+    start: float | None = None,
+    end: float | None = None,
+    margin: float = 30.0,
+) -> list[float]:
+    """
+    Returns the timestamps of video keyframes, read from packet flags so
+    nothing is decoded. With start/end only packets within margin seconds of
+    the window are read.
+    """
+    probe_args = {"select_streams": "v:0", "show_entries": "packet=pts_time,dts_time,flags"}
+    if start is not None or end is not None:
+        lower = max((start or 0.0) - margin, 0.0)
+        upper = f"{end + margin}" if end is not None else ""
+        probe_args["read_intervals"] = f"{lower}%{upper}"
+
+    probe = ffmpeg.probe(video_path, **probe_args)
+    keyframes = set()
+    for packet in probe.get("packets", []):
+        if "K" not in packet.get("flags", ""):
+            continue
+        time = packet.get("pts_time", packet.get("dts_time"))
+        if time not in (None, "N/A"):
+            keyframes.add(float(time))
+    return sorted(keyframes)
+
+
+class MediaSource:
+    """
+    Shared, decode-once view of a video file for a single analysis run.
+
+    The file is probed once on construction and the metadata is cached.
+    Decoded frames are kept in a bounded LRU cache keyed by frame number, and
+    extracted audio is cached per (start, end, format), so every stage of the
+    workflow can read from the same source instead of reopening the file.
+
+    Consumers that only need small or grayscale frames use decode_frames,
+    which has ffmpeg scale and convert them before they reach Python.
+    """
+
+    def __init__(self, video_path: str, cache_frames: int = 32):
+        """
+        Args:
+            video_path: The path to the video file.
+            cache_frames: Maximum number of decoded frames kept in memory.
+        """
+        if not Path(video_path).exists():
+            raise FileNotFoundError(f"Video file not found at: {video_path}")
+
+        self.video_path = video_path
+        self.cache_frames = cache_frames
+        self._frames = OrderedDict()
+        self._audio = {}
+        self._cap = None
+        self._position = 0
+
+        probe = ffmpeg.probe(video_path)
+        video_stream = next(
+            (s for s in probe["streams"] if s.get("codec_type") == "video"), None
+        )
+        if video_stream is None:
+            raise ValueError(f"No video stream found in: {video_path}")
+        audio_stream = next(
+            (s for s in probe["streams"] if s.get("codec_type") == "audio"), None
+        )
+
+        rate = video_stream.get("avg_frame_rate", "0/0")
+        nominal = video_stream.get("r_frame_rate", "0/1")
+        if rate.endswith("/0"):
+            rate = nominal
+        self.fps = float(Fraction(rate))
+        if self.fps <= 0:
+            raise ValueError(f"Could not determine frame rate of: {video_path}")
+        # A variable frame rate stream averages below its nominal (timebase) rate,
+        # so frame numbers and timestamps only map one-to-one when the two agree
+        nominal_fps = 0.0 if nominal.endswith("/0") else float(Fraction(nominal))
+        self.constant_frame_rate = abs(nominal_fps - self.fps) <= CFR_TOLERANCE * self.fps
+
+        self.duration = float(
+            probe["format"].get("duration") or video_stream.get("duration") or 0.0
+        )
+        self.total_frames = int(self.fps * self.duration)
+        self.width = int(video_stream["width"])
+        self.height = int(video_stream["height"])
+        self.has_audio = audio_stream is not None
+        self.audio_sample_rate = int(audio_stream["sample_rate"]) if self.has_audio else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Releases the decoder and drops cached frames and audio."""
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+        self._frames.clear()
+        self._audio.clear()
+
+    def read_frames(self, frame_numbers, seek: bool = False, cache: bool = True):
+        """
+        Yields (frame_num, frame) for the requested frames, serving cached frames
+        without decoding.
+
+        With seek=False the targets are visited in ascending order and the
+        decoder only moves forward (grab without retrieve between targets),
+        seeking only when a target lies behind the current position. With
+        seek=True every target is reached by seeking, in the given order.
+        Frames that cannot be decoded are skipped.
+        """
+        targets = frame_numbers if seek else sorted(set(frame_numbers))
+        for frame_num in targets:
+            frame = self._frames.get(frame_num)
+            if frame is not None:
+                self._frames.move_to_end(frame_num)
+            else:
+                frame = self._decode(frame_num, seek)
+                if frame is None:
+                    continue
+                if cache:
+                    self._remember(frame_num, frame)
+            yield frame_num, frame
+
+    def decode_frames(self, frame_numbers: range, size: tuple[int, int] | None = None, pix_fmt: str = "bgr24"):
+        """
+        Yields (frame_num, frame) for an evenly spaced range of frame numbers.
+
+        One ffmpeg process seeks to the first frame, keeps every step-th frame
+        (select filter), scales it to size (scale filter) and pipes it out as
+        raw pix_fmt pixels, so full-resolution frames are never copied into
+        Python. size is (width, height), or None for the original size.
+        Frames are not cached.
+
+        The seek is by time (start / fps) and frames are counted from there,
+        so a range starting after 0 only lands on the same frames as one
+        decoded from the start when constant_frame_rate is true.
+        """
+        if pix_fmt not in PIXEL_CHANNELS:
+            raise ValueError(f"Unsupported pixel format: {pix_fmt}")
+        count = len(frame_numbers)
+        if count == 0:
+            return
+        width, height = size or (self.width, self.height)
+        channels = PIXEL_CHANNELS[pix_fmt]
+        frame_bytes = width * height * channels
+        shape = (height, width) if channels == 1 else (height, width, channels)
+
+        input_args = {}
+        if frame_numbers.start > 0:
+            # Half a frame early so the accurate seek cannot skip the first target
+            input_args["ss"] = (frame_numbers.start - 0.5) / self.fps
+        stream = ffmpeg.input(self.video_path, **input_args)
+        if frame_numbers.step > 1:
+            stream = stream.filter("select", f"not(mod(n,{frame_numbers.step}))")
+        if (width, height) != (self.width, self.height):
+            stream = stream.filter("scale", width, height, flags="area")
+        process = (
+            stream.output("pipe:", format="rawvideo", pix_fmt=pix_fmt, vframes=count, vsync="passthrough")
+            .global_args("-loglevel", "error")
+            .run_async(pipe_stdout=True)
+        )
+
+        decoded = 0
+        try:
+            for frame_num in frame_numbers:
+                data = process.stdout.read(frame_bytes)
+                if len(data) < frame_bytes:
+                    break
+                decoded += 1
+                yield frame_num, np.frombuffer(data, dtype=np.uint8).reshape(shape)
+        finally:
+            process.stdout.close()
+            process.wait()
+            get_telemetry().count("frames_decoded_total", decoded, mode="ffmpeg")
+
+    def scaled_size(
+        self,
+        width: int | None = None,
+        height: int | None = None,
+        shorter_side: int | None = None,
+    ) -> tuple[int, int]:
+        """
+        Returns a (width, height) for decode_frames. A side that is not given
+        follows the aspect ratio; shorter_side sets whichever side is shorter.
+        """
+        if shorter_side is not None:
+            if self.width <= self.height:
+                width = shorter_side
+            else:
+                height = shorter_side
+        if width is None and height is None:
+            return self.width, self.height
+        if width is None:
+            width = max(1, int(self.width * height / self.height))
+        if height is None:
+            height = max(1, int(self.height * width / self.width))
+        return width, height
+
+    def frames_between(
+        self,
+        start: float,
+        end: float,
+        sample_fps: float | None = None,
+        size: tuple[int, int] | None = None,
+        pix_fmt: str | None = None,
+    ):
+        """
+        Yields (timestamp, frame) for frames in [start, end), optionally
+        decimated to sample_fps frames per second. With size or pix_fmt the
+        frames come scaled and converted from decode_frames; otherwise they
+        are full-size BGR frames from the shared, cached decoder.
+        """
+        first = max(int(start * self.fps), 0)
+        last = min(int(end * self.fps), self.total_frames)
+        step = 1 if not sample_fps else max(int(round(self.fps / sample_fps)), 1)
+        if size is None and pix_fmt is None:
+            frames = self.read_frames(range(first, last, step))
+        else:
+            frames = self.decode_frames(range(first, last, step), size, pix_fmt or "bgr24")
+        for frame_num, frame in frames:
+            yield frame_num / self.fps, frame
+
+    def audio_bytes(
+        self,
+        start: float | None = None,
+        end: float | None = None,
+        sample_rate: int | None = None,
+        channels: int | None = None,
+    ) -> bytes:
+        """
+        Returns the audio between start and end as WAV bytes, extracting it
+        from the original file only the first time it is requested.
+
+        Args:
+            start: Start time in seconds, or None for the beginning.
+            end: End time in seconds, or None for the end of the file.
+            sample_rate: Output sample rate, or None to keep the original.
+            channels: Output channel count, or None to keep the original.
+
+        Returns:
+            WAV bytes, or b"" when the file has no audio stream.
+        """
+        if not self.has_audio:
+            return b""
+
+        key = (start, end, sample_rate, channels)
+        if key not in self._audio:
+            input_args = {}
+            if start is not None:
+                input_args["ss"] = start
+            if end is not None:
+                input_args["t"] = end - (start or 0)
+            output_args = {"format": "wav", "acodec": "pcm_s16le"}
+            if sample_rate:
+                output_args["ar"] = sample_rate
+            if channels:
+                output_args["ac"] = channels
+
+            with get_telemetry().span("ffmpeg.extract_audio", start=start, end=end):
+                out, _ = (
+                    ffmpeg.input(self.video_path, **input_args)
+                    .output("pipe:", **output_args)
+                    .run(capture_stdout=True, capture_stderr=True)
+                )
+            self._audio[key] = out
+
+        return self._audio[key]
+
+    def keyframe_times(self, start: float | None = None, end: float | None = None) -> list[float]:
+        """Returns keyframe timestamps near the [start, end] window."""
+        return probe_keyframes(self.video_path, start, end)
+
+    def _capture(self):
+        if self._cap is None:
+            self._cap = cv2.VideoCapture(self.video_path)
+            if not self._cap.isOpened():
+                self._cap = None
+                raise ValueError(f"Failed to open video file: {self.video_path}")
+            self._position = 0
+        return self._cap
+
+    def _decode(self, frame_num, seek):
+        cap = self._capture()
+        if seek or frame_num < self._position:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+            self._position = frame_num
+
+        telemetry = get_telemetry()
+        start = self._position
+        while self._position < frame_num:
+            if not cap.grab():
+                telemetry.count("frames_decoded_total", self._position - start, mode="grab")
+                return None
+            self._position += 1
+        if self._position > start:
+            telemetry.count("frames_decoded_total", self._position - start, mode="grab")
+
+        ret, frame = cap.read()
+        if not ret:
+            return None
+        self._position += 1
+        telemetry.count("frames_decoded_total", mode="retrieve")
+        return frame
+
+    def _remember(self, frame_num, frame):
+        if self.cache_frames <= 0:
+            return
+        self._frames[frame_num] = frame
+        self._frames.move_to_end(frame_num)
+        while len(self._frames) > self.cache_frames:
+            self._frames.popitem(last=False)
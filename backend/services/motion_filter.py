@@ -0,0 +1,88 @@
+import cv2
+import numpy as np
+
+
+class MotionScorer:
+    """
+    Cheap local activity scorer used as the first stage of the key moment
+    cascade. Frames are shrunk to small grayscale thumbnails and compared
+    with their predecessor; the mean absolute difference is the motion energy.
+    """
+
+    def __init__(self, width=64):
+        if width < 8:
+            raise ValueError("width must be at least 8 pixels")
+        self.width = width
+
+    def prepare(self, frame):
+        """
+        Downscales a BGR frame to a float32 grayscale thumbnail. Grayscale
+        frames that are already width pixels wide, e.g. scaled by the
+        decoder, are only converted.
+        """
+        if frame.ndim == 2 and frame.shape[1] == self.width:
+            return frame.astype(np.float32)
+        height = max(1, int(frame.shape[0] * self.width / frame.shape[1]))
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.float32)
+
+    def energies(self, thumbnails, previous=None):
+        """
+        Returns the motion energy of every thumbnail in one vectorized pass.
+        The first thumbnail is compared with previous, or scores 0 without it.
+        """
+        stack = np.stack(thumbnails)
+        if previous is not None:
+            stack = np.concatenate([previous[np.newaxis], stack])
+            return np.abs(np.diff(stack, axis=0)).mean(axis=(1, 2))
+        diffs = np.abs(np.diff(stack, axis=0)).mean(axis=(1, 2))
+        return np.concatenate([[0.0], diffs])
+
+
+def motion_pass(scorer, frames, previous=None, block_size=256):
+    """
+    Scores (frame_num, frame) pairs from a decoder and returns
+    (frame_numbers, energies). Thumbnails are scored in blocks to stay
+    vectorized without holding the whole video in memory. previous is the
+    thumbnail of the sample before the first frame, if there is one.
+    """
+    scored_frames = []
+    energies = []
+    block = []
+    for frame_num, frame in frames:
+        scored_frames.append(frame_num)
+        block.append(scorer.prepare(frame))
+        if len(block) == block_size:
+            energies.append(scorer.energies(block, previous))
+            previous = block[-1]
+            block = []
+    if block:
+        energies.append(scorer.energies(block, previous))
+
+    energies = np.concatenate(energies) if energies else np.zeros(0, dtype=np.float32)
+    return scored_frames, energies
+
+
+def select_active_windows(frame_numbers, energies, window_frames, top_k, min_energy=0.0):
+    """
+    Groups samples into fixed windows of window_frames and returns the frame
+    number of the peak sample in each of the top_k most active windows,
+    in timestamp order. Windows whose peak is below min_energy are dropped.
+    """
+    frame_numbers = np.asarray(frame_numbers)
+    energies = np.asarray(energies, dtype=np.float32)
+    if frame_numbers.size == 0 or top_k < 1:
+        return []
+
+    window_ids = frame_numbers // window_frames
+    _, starts = np.unique(window_ids, return_index=True)
+    peaks = np.maximum.reduceat(energies, starts)
+    ends = np.append(starts[1:], energies.size)
+
+    order = np.argsort(-peaks, kind="stable")
+    chosen = [i for i in order[:top_k] if peaks[i] > min_energy]
+    selected = [
+        int(frame_numbers[starts[i] + np.argmax(energies[starts[i]:ends[i]])])
+        for i in chosen
+    ]
+    return sorted(selected)
@@ -0,0 +1,224 @@
+import asyncio
+import collections
+import random
+import threading
+import time
+
+import openai
+
+from telemetry import get_telemetry
+
+# Errors worth retrying: throttling, dropped connections, timeouts and 5xx
+TRANSIENT_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+def estimate_tokens(messages: list[dict], max_tokens: int = 0) -> int:
+    """
+    Rough token estimate for a chat request: ~4 characters per token of text
+    content plus the completion budget. Only used for rate limiting.
+    """
+    characters = 0
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, str):
+            characters += len(content)
+        else:
+            characters += sum(len(part.get("text", "")) for part in content)
+    return characters // 4 + max_tokens
+
+
+def record_usage(response, model: str):
+    """Counts the prompt and completion tokens reported on a chat completion."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    telemetry = get_telemetry()
+    telemetry.count("tokens_used_total", usage.prompt_tokens or 0, model=model, kind="prompt")
+    telemetry.count("tokens_used_total", usage.completion_tokens or 0, model=model, kind="completion")
+
+
+class RateLimiter:
+    """
+    Token buckets for requests per minute and tokens per minute.
+
+    Each caller reserves its cost up front and sleeps until the bucket would
+    have refilled, so concurrent callers queue fairly without holding a lock
+    while they wait.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+    ):
+        for limit in (requests_per_minute, tokens_per_minute):
+            if limit is not None and limit <= 0:
+                raise ValueError("Rate limits must be positive")
+        self._limits = (requests_per_minute, tokens_per_minute)
+        self._levels = [limit or 0.0 for limit in self._limits]
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int = 0) -> float:
+        """Reserves one request and tokens; returns the seconds to wait first."""
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._updated
+            self._updated = now
+
+            delay = 0.0
+            for i, (limit, cost) in enumerate(zip(self._limits, (1, tokens))):
+                if limit is None:
+                    continue
+                level = min(limit, self._levels[i] + elapsed * limit / 60) - cost
+                self._levels[i] = level
+                if level < 0:
+                    delay = max(delay, -level * 60 / limit)
+            return delay
+
+    async def acquire(self, tokens: int = 0):
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class SlotQueue:
+    """
+    A counting semaphore shared by every thread and event loop in the process.
+
+    Callers that find no free slot wait on a future in their own loop and are
+    queued first come, first served; release() hands the slot straight to the
+    oldest waiter by resolving its future with call_soon_threadsafe.
+    """
+
+    def __init__(self, slots: int):
+        self._free = slots
+        self._waiters = collections.deque()  # (loop, future), oldest first
+        self._lock = threading.Lock()
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                return
+            future = loop.create_future()
+            self._waiters.append((loop, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # the slot arrived just as the call was cancelled
+            else:
+                with self._lock:
+                    if (loop, future) in self._waiters:
+                        self._waiters.remove((loop, future))
+                # Otherwise _grant is already scheduled and passes the slot on
+            raise
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                loop, future = self._waiters.popleft()
+                try:
+                    loop.call_soon_threadsafe(self._grant, future)
+                    return
+                except RuntimeError:
+                    continue  # the waiter's loop has closed
+            self._free += 1
+
+    def _grant(self, future):
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+
+class RequestEngine:
+    """
+    Runs independent blocking API calls concurrently on asyncio.
+
+    Calls run in worker threads, at most max_concurrency at a time across
+    every thread and event loop using the engine, behind a requests/tokens
+    per minute limiter. Transient errors are retried with
+    full-jitter exponential backoff.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+        max_retries: int = 4,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+    ):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.max_concurrency = max_concurrency
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # run() starts a loop per call, often from several threads at once, so
+        # the limit is shared across loops rather than an asyncio.Semaphore
+        self._slots = SlotQueue(max_concurrency)
+
+    async def call(self, fn, *args, tokens: int = 0, **kwargs):
+        """
+        Calls fn(*args, **kwargs) in a thread with limiting and retries.
+
+        Each call is traced as a remote_call span; attempt latency, rate-limit
+        waits and retries are recorded per function.
+        """
+        telemetry = get_telemetry()
+        name = getattr(fn, "__qualname__", type(fn).__name__)
+        with telemetry.span("remote_call", call=name) as span:
+            await self._slots.acquire()
+            try:
+                for attempt in range(self.max_retries + 1):
+                    waited = time.perf_counter()
+                    await self.limiter.acquire(tokens)
+                    started = time.perf_counter()
+                    telemetry.observe("rate_limit_wait_seconds", started - waited, call=name)
+                    try:
+                        result = await asyncio.to_thread(fn, *args, **kwargs)
+                    except TRANSIENT_ERRORS as e:
+                        telemetry.observe("api_latency_seconds", time.perf_counter() - started, call=name)
+                        telemetry.count("api_requests_total", call=name, status="transient_error")
+                        if attempt == self.max_retries:
+                            raise
+                        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                        telemetry.count("api_retries_total", call=name)
+                        telemetry.event(
+                            "api_retry", level="warning", call=name,
+                            error=type(e).__name__, attempt=attempt + 1, delay=round(delay, 3),
+                        )
+                        await asyncio.sleep(delay)
+                    except Exception:
+                        telemetry.observe("api_latency_seconds", time.perf_counter() - started, call=name)
+                        telemetry.count("api_requests_total", call=name, status="error")
+                        raise
+                    else:
+                        telemetry.observe("api_latency_seconds", time.perf_counter() - started, call=name)
+                        telemetry.count("api_requests_total", call=name, status="ok")
+                        span.set(attempts=attempt + 1)
+                        return result
+            finally:
+                self._slots.release()
+
+    async def gather(self, calls):
+        """
+        Awaits the call() coroutines concurrently and returns their results in
+        input order. A failed call's exception is returned in its slot.
+        """
+        return await asyncio.gather(*calls, return_exceptions=True)
+
+    def run(self, coro):
+        """Runs a coroutine to completion from synchronous code."""
+        return asyncio.run(coro)
@@ -0,0 +1,146 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from telemetry import get_telemetry
+
+DEFAULT_CACHE_PATH = Path(__file__).resolve().parent / ".cache" / "responses.sqlite3"
+# Seconds a statement waits for another process's write lock before failing
+SQLITE_TIMEOUT = 30.0
+
+
+class ResponseCache:
+    """
+    Persistent, content-addressed cache for remote API responses.
+
+    Entries are keyed by a hash of the encoded payload (JPEG/WAV bytes), the
+    model name and the prompt, and stored as text in a local SQLite file.
+    Entries older than max_age seconds are ignored and purged; when the cache
+    grows past max_bytes the least recently used entries are evicted. In
+    read-only mode nothing is written, so reruns see exactly the stored
+    responses.
+    """
+
+    def __init__(
+        self,
+        path: str | Path = DEFAULT_CACHE_PATH,
+        max_bytes: int = 512 * 1024 * 1024,
+        max_age: float = 30 * 24 * 3600,
+        read_only: bool = False,
+    ):
+        """
+        Args:
+            path: The SQLite file backing the cache.
+            max_bytes: Total stored value size above which LRU entries are evicted.
+            max_age: Seconds after which an entry expires.
+            read_only: Never insert, update or evict entries.
+        """
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.read_only = read_only
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        if read_only:
+            # mode=ro fails loudly if the cache has never been written
+            self._db = sqlite3.connect(
+                f"file:{self.path}?mode=ro", uri=True, timeout=SQLITE_TIMEOUT, check_same_thread=False
+            )
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT, check_same_thread=False)
+            # Several processes share the cache; WAL lets readers run during a write
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(payload: bytes, model: str, prompt: str) -> str:
+        """Hashes the payload, model and prompt into a cache key."""
+        digest = hashlib.sha256()
+        for part in (model.encode("utf-8"), prompt.encode("utf-8"), bytes(payload)):
+            # Length prefixes keep ("ab", "c") and ("a", "bc") apart
+            digest.update(len(part).to_bytes(8, "big"))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> str | None:
+        """Returns the cached value for key, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age:
+                self.misses += 1
+                get_telemetry().count("cache_requests_total", result="miss")
+                return None
+
+            self.hits += 1
+            get_telemetry().count("cache_requests_total", result="hit")
+            if not self.read_only:
+                self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                self._db.commit()
+            return row[0]
+
+    def put(self, key: str, value: str):
+        """Stores value under key and evicts entries if the cache is too large."""
+        if self.read_only:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now),
+            )
+            self.writes += 1
+            self._evict(now)
+            self._db.commit()
+
+    def stats(self) -> dict:
+        """Returns hit/miss/write/eviction counters and the current size."""
+        with self._lock:
+            entries, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def close(self):
+        self._db.close()
+
+    def _evict(self, now):
+        cursor = self._db.execute(
+            "DELETE FROM responses WHERE created < ?", (now - self.max_age,)
+        )
+        self.evictions += cursor.rowcount
+
+        (size,) = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if size <= self.max_bytes:
+            return
+        rows = self._db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall()
+        stale = []
+        for key, entry_size in rows:
+            if size <= self.max_bytes:
+                break
+            stale.append((key,))
+            size -= entry_size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", stale)
+        self.evictions += len(stale)
@@ -1,6 +1,9 @@
+import asyncio
 import base64
-import tempfile
-import wave
+import difflib
+import math
+import re
+import time
 from pathlib import Path
 
 import ffmpeg
@@ -8,25 +11,106 @@ from openai import OpenAI
 from openai.types.chat import ChatCompletionMessage
 from tqdm import tqdm
 
+from media_source import MediaSource
+from request_engine import RequestEngine, record_usage
+from response_cache import ResponseCache
+from telemetry import get_telemetry, peak_memory_mb
+from vad import detect_speech, pcm_to_samples
+from wav_buffer import WavChunk, iter_wav_chunks, parse_wav, wav_header, wav_slice
+
+AUDIO_MODEL = "gpt-4o-audio-preview"
+# Upper bound on speaking rate, used to size the word window searched for a chunk overlap
+WORDS_PER_SECOND = 4
+
+AUDIO_PROMPT = "What is in this recording? Give brief tonal cues and evaluations too along with the transcription. Cut out the fluff - just give what I want."
+
+
+def stitch_transcripts(
+    transcripts: list[str],
+    max_overlap_words: int = 8,
+    min_match_words: int = 3,
+    edge_slack: int = 2,
+) -> str:
+    """
+    Joins ordered transcripts of overlapping audio chunks, removing the words
+    repeated in the overlap.
+
+    The longest common run of words between the end of the text so far and the
+    start of the next transcript (compared case- and punctuation-insensitively)
+    is treated as the overlap; words cut at a chunk boundary therefore survive
+    from whichever side heard them whole. Only the last and first
+    max_overlap_words words are searched, and the run must reach to within
+    edge_slack words of both edges, so a phrase repeated elsewhere in the
+    speech is never mistaken for the overlap.
+
+    Args:
+        transcripts: Transcripts in chunk order.
+        max_overlap_words: How many words at each boundary are searched; about
+            the words that fit in the audio overlap.
+        min_match_words: Shortest run accepted as a real overlap.
+        edge_slack: Most words (cut at the boundary) allowed between the run
+            and the end of the text so far or the start of the next transcript.
+
+    Returns:
+        The combined transcript.
+    """
+    def normalize(word: str) -> str:
+        return re.sub(r"[^\w']", "", word.lower())
+
+    words: list[str] = []
+    for transcript in transcripts:
+        incoming = transcript.split()
+        tail = words[-max_overlap_words:]
+        head = incoming[:max_overlap_words]
+        match = difflib.SequenceMatcher(
+            None, [normalize(w) for w in tail], [normalize(w) for w in head], autojunk=False
+        ).find_longest_match(0, len(tail), 0, len(head))
+
+        touches_edges = (
+            len(tail) - (match.a + match.size) <= edge_slack and match.b <= edge_slack
+        )
+        if match.size >= min_match_words and touches_edges:
+            # Keep our words up to the overlap, then continue from the overlap in the new chunk
+            words = words[:len(words) - len(tail) + match.a] + incoming[match.b:]
+        else:
+            words.extend(incoming)
+    return " ".join(words)
+
 
 class AudioAnalyzer:
     """
     A class for analyzing audio files, including MP4 to WAV conversion and OpenAI analysis.
     """
 
-    def __init__(self, openai_client: OpenAI):
+    def __init__(
+        self,
+        openai_client: OpenAI,
+        request_engine: RequestEngine | None = None,
+        cache: ResponseCache | None = None,
+    ):
         """
         Initializes the AudioAnalyzer with an OpenAI client.
 
         Args:
             openai_client: An instance of the OpenAI client.
+            request_engine: Optional engine used to transcribe chunks concurrently.
+            cache: Optional response cache keyed by the WAV bytes, model and prompt.
         """
         self.client = openai_client
+        self.request_engine = request_engine
+        self.cache = cache
         self.CHUNK_DURATION = 120  # 2 minutes in seconds
+        self.SAMPLE_RATE = 16000  # audio is extracted once at 16 kHz mono PCM
+        self.CHUNK_OVERLAP = 2  # seconds repeated between streamed chunks
+        self.MAX_SPEECH_GAP = 3  # seconds of silence that end a speech chunk
+        self.last_chunking_stats: dict = {}
+        self.last_streaming_stats: dict = {}
+        self.last_speech_timeline: list[dict] = []
 
     def extract_audio_bytes(self, mp4_path: str) -> bytes:
         """
-        Extracts audio bytes from an MP4 file using ffmpeg.
+        Extracts audio bytes from an MP4 file using ffmpeg, directly in the
+        16 kHz mono PCM format used for chunking.
 
         Args:
             mp4_path: The path to the MP4 file.
@@ -41,15 +125,38 @@ class AudioAnalyzer:
 
         out, _ = (
             ffmpeg.input(mp4_path)
-            .output("pipe:", format="wav")
+            .output("pipe:", format="wav", acodec="pcm_s16le", ac=1, ar=self.SAMPLE_RATE)
             .run(capture_stdout=True, capture_stderr=True)
         )
 
         return out
 
+    def to_target_format(self, wav_bytes: bytes) -> bytes:
+        """
+        Converts WAV bytes to 16 kHz mono 16-bit PCM in a single in-memory
+        ffmpeg pass, returning the input unchanged if it already matches.
+
+        Args:
+            wav_bytes: The audio data in bytes.
+
+        Returns:
+            The audio data in the target format.
+        """
+        info = parse_wav(wav_bytes)
+        if (info.sample_rate, info.channels, info.sample_width) == (self.SAMPLE_RATE, 1, 2):
+            return wav_bytes
+
+        out, _ = (
+            ffmpeg.input("pipe:", format="wav")
+            .output("pipe:", format="wav", acodec="pcm_s16le", ac=1, ar=self.SAMPLE_RATE)
+            .run(input=wav_bytes, capture_stdout=True, capture_stderr=True)
+        )
+        return out
+
     def get_audio_duration(self, wav_bytes: bytes) -> float:
         """
-        Get the duration of audio in seconds from WAV bytes.
+        Get the duration of audio in seconds from WAV bytes, read from the
+        header in memory.
 
         Args:
             wav_bytes: The audio data in bytes.
@@ -57,15 +164,37 @@ class AudioAnalyzer:
         Returns:
             Duration in seconds.
         """
-        with tempfile.NamedTemporaryFile(suffix=".wav") as temp_file:
-            temp_file.write(wav_bytes)
-            temp_file.flush()
+        return parse_wav(wav_bytes).duration
+
+    def iter_chunks(self, wav_bytes: bytes):
+        """
+        Split audio into CHUNK_DURATION second chunks without copying the PCM.
 
-            with wave.open(temp_file.name, "rb") as wav_file:
-                frames = wav_file.getnframes()
-                rate = wav_file.getframerate()
-                duration = frames / float(rate)
-                return duration
+        The audio is converted to the target format once if needed; each chunk
+        is a memoryview slice of that buffer with its own WAV header. Time to
+        first chunk, total time and peak memory are recorded in
+        last_chunking_stats.
+
+        Args:
+            wav_bytes: The audio data in bytes.
+
+        Yields:
+            WavChunk objects in time order.
+        """
+        started = time.perf_counter()
+        wav_bytes = self.to_target_format(wav_bytes)
+        stats = {"chunks": 0, "time_to_first_chunk": None}
+        self.last_chunking_stats = stats
+
+        for chunk in iter_wav_chunks(wav_bytes, self.CHUNK_DURATION):
+            if stats["time_to_first_chunk"] is None:
+                stats["time_to_first_chunk"] = time.perf_counter() - started
+            stats["chunks"] += 1
+            yield chunk
+
+        stats["total_time"] = time.perf_counter() - started
+        stats["peak_memory_mb"] = peak_memory_mb()
+        get_telemetry().event("audio_chunked", **stats)
 
     def chunk_audio(self, wav_bytes: bytes) -> list[bytes]:
         """
@@ -77,29 +206,7 @@ class AudioAnalyzer:
         Returns:
             List of audio chunks in bytes.
         """
-        chunks = []
-        with tempfile.NamedTemporaryFile(suffix=".wav") as input_file:
-            input_file.write(wav_bytes)
-            input_file.flush()
-
-            probe = ffmpeg.probe(input_file.name)
-            duration = float(probe["format"]["duration"])
-
-            for start_time in range(0, int(duration), self.CHUNK_DURATION):
-                with tempfile.NamedTemporaryFile(suffix=".wav") as chunk_file:
-                    stream = (
-                        ffmpeg.input(
-                            input_file.name, ss=start_time, t=self.CHUNK_DURATION
-                        )
-                        .output(chunk_file.name, acodec="pcm_s16le", ac=1, ar=16000)
-                        .overwrite_output()
-                    )
-                    ffmpeg.run(stream, capture_stdout=True, capture_stderr=True)
-
-                    with open(chunk_file.name, "rb") as f:
-                        chunks.append(f.read())
-
-        return chunks
+        return [bytes(chunk) for chunk in self.iter_chunks(wav_bytes)]
 
     def parse_audio_file(self, wav_path: str) -> bytes:
         """
@@ -121,20 +228,32 @@ class AudioAnalyzer:
 
         return wav_data
 
-    def analyze_audio(self, audio_bytes: bytes) -> ChatCompletionMessage:
+    def analyze_audio(self, audio_bytes: bytes | WavChunk) -> ChatCompletionMessage:
         """
         Analyzes audio bytes using the OpenAI API.
 
+        Responses are served from the cache when the same audio was analyzed
+        before with the same model and prompt.
+
         Args:
-            audio_bytes: The audio data in bytes.
+            audio_bytes: The audio data in bytes, or a WavChunk.
 
         Returns:
             The ChatCompletionMessage object containing the model's response.
         """
+        audio_bytes = bytes(audio_bytes)
+        cache_key = None
+        if self.cache is not None:
+            cache_key = ResponseCache.make_key(audio_bytes, AUDIO_MODEL, AUDIO_PROMPT)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return ChatCompletionMessage.model_validate_json(cached)
+
         encoded_string = base64.b64encode(audio_bytes).decode("utf-8")
+        get_telemetry().count("bytes_uploaded_total", len(encoded_string), api="openai_audio")
 
         completion = self.client.chat.completions.create(
-            model="gpt-4o-audio-preview",
+            model=AUDIO_MODEL,
             modalities=["text", "audio"],
             audio={"voice": "alloy", "format": "wav"},
             messages=[
@@ -143,7 +262,7 @@ class AudioAnalyzer:
                     "content": [
                         {
                             "type": "text",
-                            "text": "What is in this recording? Give brief tonal cues and evaluations too along with the transcription. Cut out the fluff - just give what I want.",
+                            "text": AUDIO_PROMPT,
                         },
                         {
                             "type": "input_audio",
@@ -154,46 +273,319 @@ class AudioAnalyzer:
             ],
         )
 
-        return completion.choices[0].message
+        record_usage(completion, AUDIO_MODEL)
+        message = completion.choices[0].message
+        if cache_key is not None:
+            self.cache.put(cache_key, self._cacheable(message).model_dump_json())
+        return message
+
+    @staticmethod
+    def _cacheable(message: ChatCompletionMessage) -> ChatCompletionMessage:
+        """
+        Returns a copy of message without the base64 audio of the spoken
+        reply, which callers never read but would dominate the cache entry.
+        """
+        if message.audio is None:
+            return message
+        return message.model_copy(update={"audio": message.audio.model_copy(update={"data": ""})})
+
+    def detect_speech_segments(self, wav_bytes: bytes) -> list[tuple[float, float]]:
+        """
+        Finds speech regions locally with the VAD in vad.detect_speech.
+
+        Args:
+            wav_bytes: The audio data in bytes.
+
+        Returns:
+            (start, end) times in seconds of each speech region.
+        """
+        wav_bytes = self.to_target_format(wav_bytes)
+        info = parse_wav(wav_bytes)
+        pcm = memoryview(wav_bytes)[info.data_offset:info.data_offset + info.data_size]
+        return detect_speech(pcm_to_samples(pcm), info.sample_rate)
+
+    def iter_speech_chunks(self, wav_bytes: bytes):
+        """
+        Builds chunks that cover speech only.
+
+        Consecutive speech regions are grouped while the group spans at most
+        CHUNK_DURATION seconds and no gap inside it is longer than
+        MAX_SPEECH_GAP seconds; each group becomes one zero-copy chunk from its
+        first region's start to its last region's end, so long silences are
+        never uploaded and chunk times stay on the original timeline. Regions
+        longer than CHUNK_DURATION are split.
+
+        Args:
+            wav_bytes: The audio data in bytes.
+
+        Yields:
+            WavChunk objects whose start/end are original timestamps.
+        """
+        wav_bytes = self.to_target_format(wav_bytes)
+        info = parse_wav(wav_bytes)
+
+        spans = []
+        for start, end in self.detect_speech_segments(wav_bytes):
+            while end - start > self.CHUNK_DURATION:
+                spans.append((start, start + self.CHUNK_DURATION))
+                start += self.CHUNK_DURATION
+            if (
+                spans
+                and end - spans[-1][0] <= self.CHUNK_DURATION
+                and start - spans[-1][1] <= self.MAX_SPEECH_GAP
+            ):
+                spans[-1] = (spans[-1][0], end)
+            else:
+                spans.append((start, end))
+
+        for start, end in spans:
+            yield wav_slice(wav_bytes, start, end, info)
+
+    def analyze_speech_timeline(self, audio_bytes: bytes, offset: float = 0.0) -> list[dict]:
+        """
+        Transcribes only the speech in the audio and returns a timeline.
 
-    def analyze_audio_with_chunking(self, audio_bytes: bytes) -> str:
+        Args:
+            audio_bytes: The audio data in bytes.
+            offset: Seconds added to every timestamp, e.g. the start of the
+                window the audio was cut from, so times match the video.
+
+        Returns:
+            Dicts with start, end and transcript for each speech chunk.
+        """
+        chunks = list(self.iter_speech_chunks(audio_bytes))
+        transcripts = self._transcribe_chunks(chunks)
+        timeline = [
+            {"start": chunk.start + offset, "end": chunk.end + offset, "transcript": transcript}
+            for chunk, transcript in zip(chunks, transcripts)
+        ]
+        self.last_speech_timeline = timeline
+        return timeline
+
+    def analyze_audio_with_chunking(self, audio_bytes: bytes, vad: bool = False) -> str:
         """
         Analyzes audio with automatic chunking for long files.
 
         Args:
             audio_bytes: The audio data in bytes.
+            vad: Skip non-speech audio and only transcribe speech chunks; the
+                timeline is kept in last_speech_timeline.
 
         Returns:
             Combined transcription string from all chunks.
         """
+        if vad:
+            timeline = self.analyze_speech_timeline(audio_bytes)
+            return " ".join(entry["transcript"] for entry in timeline)
+
         duration = self.get_audio_duration(audio_bytes)
 
         if duration <= self.CHUNK_DURATION:
+            # With audio output the text is in the audio transcript, not content
             response = self.analyze_audio(audio_bytes)
-            return response.content[0].text
+            return response.audio.transcript
+
+        chunks = list(self.iter_chunks(audio_bytes))
+        return " ".join(self._transcribe_chunks(chunks))
+
+    def _transcribe_chunks(self, chunks: list[WavChunk]) -> list[str]:
+        """
+        Transcribes chunks, concurrently when a request engine is set.
+
+        Args:
+            chunks: The audio chunks.
+
+        Returns:
+            One transcript per chunk, in chunk order.
+        """
+        if self.request_engine is not None:
+            responses = self.request_engine.run(self._analyze_chunks_async(chunks))
+            return [response.to_dict()['audio']['transcript'] for response in responses]
 
-        chunks = self.chunk_audio(audio_bytes)
         transcriptions = []
 
         for chunk in tqdm(chunks):
             response = self.analyze_audio(chunk)
             transcriptions.append(response.to_dict()['audio']['transcript'])
 
-        return " ".join(transcriptions)
+        return transcriptions
 
-    def analyze_mp4_audio(self, mp4_path: str) -> str:
+    async def _analyze_chunks_async(self, chunks: list[WavChunk]) -> list[ChatCompletionMessage]:
+        """
+        Transcribes chunks concurrently through the request engine, in order.
+
+        Args:
+            chunks: The audio chunks.
+
+        Returns:
+            One ChatCompletionMessage per chunk, in chunk order.
+
+        Raises:
+            Exception: The first error of any chunk that failed after retries.
+        """
+        progress = tqdm(total=len(chunks))
+
+        async def analyze(chunk: WavChunk) -> ChatCompletionMessage:
+            response = await self.request_engine.call(self.analyze_audio, chunk)
+            progress.update()
+            return response
+
+        try:
+            responses = await self.request_engine.gather([analyze(chunk) for chunk in chunks])
+        finally:
+            progress.close()
+
+        for response in responses:
+            if isinstance(response, Exception):
+                raise response
+        return responses
+
+    def analyze_mp4_audio(self, mp4_path: str, streaming: bool = False) -> str:
         """
         Analyzes audio from an MP4 file using the OpenAI API with chunking support.
 
         Args:
             mp4_path: The path to the MP4 file.
+            streaming: Transcribe chunks while ffmpeg is still extracting
+                (see analyze_mp4_audio_streaming).
 
         Returns:
             Combined transcription string.
         """
+        if streaming:
+            return self.analyze_mp4_audio_streaming(mp4_path)
         audio_bytes = self.extract_audio_bytes(mp4_path)
         return self.analyze_audio_with_chunking(audio_bytes)
 
+    def analyze_mp4_audio_streaming(self, mp4_path: str) -> str:
+        """
+        Transcribes an MP4's audio while it is being extracted.
+
+        PCM is read from the ffmpeg pipe incrementally and each chunk is sent
+        for transcription as soon as it is complete, several at a time through
+        the request engine. Reading pauses while 2 * max_concurrency chunks
+        are in flight, so a slow API never lets unsent PCM pile up. Consecutive chunks share CHUNK_OVERLAP seconds so
+        words at a boundary are not lost; the overlap is removed when the
+        ordered transcripts are joined. Time to first transcript and wall time
+        are recorded in last_streaming_stats.
+
+        Args:
+            mp4_path: The path to the MP4 file.
+
+        Returns:
+            Combined transcription string.
+
+        Raises:
+            AssertionError: If the MP4 file does not exist.
+        """
+        assert Path(mp4_path).exists(), "Incorrect filepath provided."
+
+        engine = self.request_engine or RequestEngine()
+        transcripts = engine.run(self._stream_transcripts_async(mp4_path, engine))
+        overlap_words = max(math.ceil(self.CHUNK_OVERLAP * WORDS_PER_SECOND), 1)
+        return stitch_transcripts(transcripts, max_overlap_words=overlap_words)
+
+    async def _stream_transcripts_async(self, mp4_path: str, engine: RequestEngine) -> list[str]:
+        """
+        Reads PCM chunks from ffmpeg and transcribes them concurrently.
+
+        Args:
+            mp4_path: The path to the MP4 file.
+            engine: The request engine used for the transcription calls.
+
+        Returns:
+            One transcript per chunk, in chunk order.
+        """
+        started = time.perf_counter()
+        stats = {"chunks": 0, "time_to_first_transcript": None}
+        self.last_streaming_stats = stats
+
+        bytes_per_second = self.SAMPLE_RATE * 2
+        chunk_bytes = self.CHUNK_DURATION * bytes_per_second
+        overlap_bytes = min(int(self.CHUNK_OVERLAP * bytes_per_second), chunk_bytes // 2)
+        overlap_bytes -= overlap_bytes % 2
+
+        def transcribed(_):
+            if stats["time_to_first_transcript"] is None:
+                stats["time_to_first_transcript"] = time.perf_counter() - started
+
+        process = (
+            ffmpeg.input(mp4_path)
+            .output("pipe:", format="s16le", acodec="pcm_s16le", ac=1, ar=self.SAMPLE_RATE)
+            .global_args("-loglevel", "error")
+            .run_async(pipe_stdout=True)
+        )
+        tasks = []
+        tail = b""
+        consumed = 0
+        try:
+            while True:
+                wanted = chunk_bytes - len(tail)
+                data = await asyncio.to_thread(process.stdout.read, wanted)
+                if not data:
+                    break
+                pcm = tail + data
+                start = (consumed - len(tail)) / bytes_per_second
+                consumed += len(data)
+
+                chunk = WavChunk(
+                    wav_header(len(pcm), self.SAMPLE_RATE, 1, 2),
+                    memoryview(pcm),
+                    start,
+                    consumed / bytes_per_second,
+                )
+                task = asyncio.ensure_future(engine.call(self.analyze_audio, chunk))
+                task.add_done_callback(transcribed)
+                tasks.append(task)
+                stats["chunks"] += 1
+
+                # Each waiting task holds its chunk's PCM, so bound how many are outstanding
+                outstanding = [t for t in tasks if not t.done()]
+                if len(outstanding) >= 2 * engine.max_concurrency:
+                    await asyncio.wait(outstanding, return_when=asyncio.FIRST_COMPLETED)
+
+                if len(data) < wanted:
+                    break
+                tail = pcm[len(pcm) - overlap_bytes:] if overlap_bytes else b""
+        finally:
+            process.stdout.close()
+            await asyncio.to_thread(process.wait)
+
+        responses = await engine.gather(tasks)
+        for response in responses:
+            if isinstance(response, Exception):
+                raise response
+
+        stats["total_time"] = time.perf_counter() - started
+        get_telemetry().event("audio_streamed", **stats)
+        return [response.to_dict()['audio']['transcript'] for response in responses]
+
+    def analyze_source_audio(
+        self,
+        source: MediaSource,
+        start: float | None = None,
+        end: float | None = None,
+        vad: bool = False,
+    ) -> str:
+        """
+        Analyzes audio from a shared MediaSource, optionally limited to a window.
+
+        Args:
+            source: The MediaSource of the video being analyzed.
+            start: Start of the window in seconds, or None for the beginning.
+            end: End of the window in seconds, or None for the end of the file.
+            vad: Only transcribe speech; the timeline in last_speech_timeline
+                uses video timestamps.
+
+        Returns:
+            Combined transcription string.
+        """
+        audio_bytes = source.audio_bytes(start, end, sample_rate=self.SAMPLE_RATE, channels=1)
+        if vad:
+            timeline = self.analyze_speech_timeline(audio_bytes, offset=start or 0.0)
+            return " ".join(entry["transcript"] for entry in timeline)
+        return self.analyze_audio_with_chunking(audio_bytes)
+
     def analyze_wav_audio(self, wav_path: str) -> str:
         """
         Analyzes audio from a wav file using the OpenAI API with chunking support.
@@ -208,6 +600,67 @@ class AudioAnalyzer:
         return self.analyze_audio_with_chunking(audio_bytes)
 
 
+class SubtitleGenerator:
+    """
+    Produces a transcript for a video and saves it as a text file next to it.
+    """
+
+    NO_AUDIO_TEXT = "No audio content detected in the video."
+
+    def __init__(
+        self,
+        openai_client: OpenAI,
+        request_engine: RequestEngine | None = None,
+        cache: ResponseCache | None = None,
+    ):
+        """
+        Initializes the SubtitleGenerator with an OpenAI client.
+
+        Args:
+            openai_client: An instance of the OpenAI client.
+            request_engine: Optional engine used to transcribe chunks concurrently.
+            cache: Optional response cache for transcription calls.
+        """
+        self.audio_analyzer = AudioAnalyzer(openai_client, request_engine, cache)
+
+    def extract_text(
+        self,
+        video_path: str,
+        source: MediaSource | None = None,
+        start: float | None = None,
+        end: float | None = None,
+    ) -> tuple[str, str]:
+        """
+        Transcribes the audio of a video.
+
+        When a MediaSource is given, the audio is read from it (limited to the
+        start/end window) instead of decoding video_path again.
+
+        Args:
+            video_path: The path to the video; the transcript is saved beside it.
+            source: Optional MediaSource to read the audio from.
+            start: Start of the window in seconds when reading from source.
+            end: End of the window in seconds when reading from source.
+
+        Returns:
+            A (transcript_path, transcript) tuple.
+        """
+        if source is not None:
+            if source.has_audio:
+                transcript = self.audio_analyzer.analyze_source_audio(source, start, end)
+            else:
+                transcript = self.NO_AUDIO_TEXT
+        else:
+            transcript = self.audio_analyzer.analyze_mp4_audio(video_path)
+
+        transcript = transcript or self.NO_AUDIO_TEXT
+        transcript_path = str(Path(video_path).with_suffix(".txt"))
+        with open(transcript_path, "w") as f:
+            f.write(transcript)
+
+        return transcript_path, transcript
+
+
 if __name__ == "__main__":
     client = OpenAI()
     analyzer = AudioAnalyzer(client)
@@ -0,0 +1,263 @@
+import contextvars
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+from bisect import bisect_left
+
+# Upper bounds in seconds for latency histograms; +Inf is implied
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+METRIC_PREFIX = "bodycam_"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """A timed operation. Nested spans started in the same context become its children."""
+
+    __slots__ = ("telemetry", "name", "attributes", "trace_id", "span_id", "parent_id", "_start", "_token")
+
+    def __init__(self, telemetry, name: str, attributes: dict):
+        self.telemetry = telemetry
+        self.name = name
+        self.attributes = attributes
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = None
+        self.trace_id = None
+        self._start = None
+        self._token = None
+
+    def set(self, **attributes):
+        """Adds attributes recorded when the span ends."""
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self._token = _current_span.set(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._start
+        _current_span.reset(self._token)
+        self.telemetry._end_span(self, duration, exc)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class NoopTelemetry:
+    """Telemetry that records nothing; every call returns immediately."""
+
+    enabled = False
+
+    def span(self, name: str, **attributes):
+        return _NOOP_SPAN
+
+    def count(self, name: str, value: float = 1, **labels):
+        pass
+
+    def observe(self, name: str, value: float, **labels):
+        pass
+
+    def event(self, name: str, level: str = "info", **fields):
+        pass
+
+    def prometheus_text(self) -> str:
+        return ""
+
+    def snapshot(self) -> dict:
+        return {"counters": {}, "histograms": {}}
+
+    def flush(self):
+        pass
+
+
+class Telemetry:
+    """
+    In-process spans, counters and histograms.
+
+    Finished spans and events are written as one JSON object per line to
+    log_path (or stderr). Every span's duration also feeds the
+    span_duration_seconds histogram. Metrics are rendered in the Prometheus
+    text format by prometheus_text(), and flush() writes them to metrics_path.
+    """
+
+    enabled = True
+
+    def __init__(self, log_path: str | None = None, metrics_path: str | None = None, buckets=DEFAULT_BUCKETS):
+        self.metrics_path = metrics_path
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._log = open(log_path, "a", buffering=1) if log_path else sys.stderr
+
+    def span(self, name: str, **attributes) -> Span:
+        return Span(self, name, attributes)
+
+    def count(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][bisect_left(self.buckets, value)] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def event(self, name: str, level: str = "info", **fields):
+        """Writes a log line, attached to the current span if there is one."""
+        record = {"type": "event", "time": time.time(), "level": level, "name": name}
+        span = _current_span.get()
+        if span is not None:
+            record["trace_id"] = span.trace_id
+            record["span_id"] = span.span_id
+        record.update(fields)
+        self._write(record)
+
+    def snapshot(self) -> dict:
+        """Returns counter values and histogram counts and sums keyed by metric{labels}."""
+        with self._lock:
+            return {
+                "counters": {name + _labels(labels): value for (name, labels), value in self._counters.items()},
+                "histograms": {
+                    name + _labels(labels): {"count": histogram[2], "sum": histogram[1]}
+                    for (name, labels), histogram in self._histograms.items()
+                },
+            }
+
+    def prometheus_text(self) -> str:
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, ([*h[0]], h[1], h[2])) for key, h in self._histograms.items())
+
+        lines = []
+        declared = set()
+        for (name, labels), value in counters:
+            metric = METRIC_PREFIX + name
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_labels(labels)} {_number(value)}")
+
+        for (name, labels), (counts, total, observations) in histograms:
+            metric = METRIC_PREFIX + name
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                lines.append(f"{metric}_bucket{_labels(labels + (('le', _number(bound)),))} {cumulative}")
+            lines.append(f"{metric}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{metric}_count{_labels(labels)} {observations}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def flush(self):
+        """Writes the current metrics to metrics_path, if set."""
+        if not self.metrics_path:
+            return
+        # Write then rename so scrapers never read a half-written file
+        temp_path = f"{self.metrics_path}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(temp_path, self.metrics_path)
+
+    def _end_span(self, span: Span, duration: float, exc):
+        self.observe("span_duration_seconds", duration, span=span.name)
+        record = {
+            "type": "span",
+            "time": time.time(),
+            "name": span.name,
+            "trace_id": span.trace_id,
+            "span_id": span.span_id,
+            "parent_id": span.parent_id,
+            "duration_ms": round(duration * 1000, 3),
+            "status": "error" if exc is not None else "ok",
+        }
+        if exc is not None:
+            record["error"] = f"{type(exc).__name__}: {exc}"
+        record.update(span.attributes)
+        self._write(record)
+
+    def _write(self, record: dict):
+        line = json.dumps(record, default=str)
+        with self._lock:
+            self._log.write(line + "\n")
+
+
+def _labels(labels) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _number(value) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+_telemetry = NoopTelemetry()
+
+
+def peak_memory_mb() -> float:
+    """Returns the peak resident memory of this process in MB."""
+    # ru_maxrss is reported in bytes on macOS and kilobytes elsewhere
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def get_telemetry():
+    """Returns the process-wide telemetry, a NoopTelemetry unless configured."""
+    return _telemetry
+
+
+def configure(enabled: bool = True, log_path: str | None = None, metrics_path: str | None = None):
+    """Replaces the process-wide telemetry and returns it."""
+    global _telemetry
+    _telemetry = Telemetry(log_path, metrics_path) if enabled else NoopTelemetry()
+    return _telemetry
+
+
+def configure_from_env():
+    """
+    Configures telemetry from TELEMETRY ("off" disables it), TELEMETRY_LOG (JSON
+    log file, stderr if unset) and TELEMETRY_METRICS (Prometheus text file).
+    """
+    return configure(
+        enabled=os.getenv("TELEMETRY", "on").lower() not in ("off", "0", "false", "no"),
+        log_path=os.getenv("TELEMETRY_LOG") or None,
+        metrics_path=os.getenv("TELEMETRY_METRICS") or None,
+    )
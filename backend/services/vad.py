@@ -0,0 +1,79 @@
+import numpy as np
+
+
+def pcm_to_samples(pcm, sample_width: int = 2) -> np.ndarray:
+    """Views 16-bit PCM bytes as float32 samples in [-1, 1]."""
+    if sample_width != 2:
+        raise ValueError("Only 16-bit PCM is supported")
+    return np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+
+
+def detect_speech(
+    samples: np.ndarray,
+    sample_rate: int,
+    frame_ms: float = 30,
+    threshold_db: float = 12.0,
+    min_energy_db: float = -55.0,
+    max_zcr: float = 0.35,
+    hangover_ms: float = 300,
+    min_speech_ms: float = 250,
+    merge_gap_ms: float = 500,
+) -> list[tuple[float, float]]:
+    """
+    Finds speech regions with short-time energy and zero-crossing rate.
+
+    Frames louder than the noise floor (10th percentile of frame energy) by
+    threshold_db, and above min_energy_db, count as voiced unless their
+    zero-crossing rate is above max_zcr, which is typical of wind and hiss.
+    Voiced decisions are held for hangover_ms to bridge short pauses, runs
+    separated by gaps under merge_gap_ms are merged, and merged regions
+    shorter than min_speech_ms are then dropped.
+
+    Returns:
+        (start, end) times in seconds, in order.
+    """
+    frame_length = max(int(sample_rate * frame_ms / 1000), 1)
+    count = len(samples) // frame_length
+    if count == 0:
+        return []
+
+    frames = samples[:count * frame_length].reshape(count, frame_length)
+    energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+    signs = np.signbit(frames)
+    zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+
+    threshold = max(np.percentile(energy_db, 10) + threshold_db, min_energy_db)
+    voiced = (energy_db > threshold) & (zcr < max_zcr)
+
+    # Hangover: a voiced frame keeps the next few frames voiced
+    hangover = int(hangover_ms / frame_ms)
+    if hangover:
+        voiced = np.convolve(voiced, np.ones(hangover + 1), mode="full")[:count] > 0
+
+    edges = np.diff(np.concatenate([[0], voiced.astype(np.int8), [0]]))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    frame_seconds = frame_length / sample_rate
+    segments = []
+    for start, end in zip(starts * frame_seconds, ends * frame_seconds):
+        if segments and start - segments[-1][1] < merge_gap_ms / 1000:
+            segments[-1] = (segments[-1][0], end)
+        else:
+            segments.append((start, end))
+    return [
+        (float(start), float(end))
+        for start, end in segments
+        if end - start >= min_speech_ms / 1000
+    ]
+
+
+def speech_mask(timestamps, segments: list[tuple[float, float]]) -> np.ndarray:
+    """Returns a boolean array marking which timestamps fall inside a segment."""
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if not segments:
+        return np.zeros(timestamps.shape, dtype=bool)
+    starts = np.array([start for start, _ in segments])
+    ends = np.array([end for _, end in segments])
+    index = np.searchsorted(starts, timestamps, side="right") - 1
+    return (index >= 0) & (timestamps < ends[np.clip(index, 0, None)])
@@ -1,27 +1,112 @@
+import bisect
+import re
+from pathlib import Path
+
+import ffmpeg
 from moviepy.editor import VideoFileClip
 import openai
 
+from media_source import probe_keyframes
+from telemetry import get_telemetry
+
+def clip_path(video_path, tag):
+    """Returns the path of a clip cut from video_path: <stem><tag><suffix> beside it"""
+    path = Path(video_path)
+    return str(path.with_name(f'{path.stem}{tag}{path.suffix}'))
+
+def is_clip_path(video_path):
+    """True for clips named by clip_path with a _trimmed or _trimmed_<i> tag"""
+    return re.search(r'_trimmed(_\d+)?$', Path(video_path).stem) is not None
+
 class VideoTrimmer:
     def __init__(self, api_key=None):
         if api_key:
             openai.api_key = api_key
 
-    def trim_video(self, video_path, timestamp, duration=25):
+    def clip_window(self, timestamp, video_duration, duration=25):
         """
-        Extracts a segment of video centered around the key timestamp
-        Duration is split evenly before and after the timestamp
+        Returns the (start, end) of a window of the given duration centered on
+        timestamp and clamped to the video
         """
-        video = VideoFileClip(video_path)
         half_duration = duration / 2
         
         start_time = max(0, timestamp - half_duration)
-        end_time = min(video.duration, timestamp + half_duration)
-        
-        trimmed = video.subclip(start_time, end_time)
-        output_path = video_path.replace('.mp4', '_trimmed.mp4')
-        trimmed.write_videofile(output_path)
+        end_time = min(video_duration, timestamp + half_duration)
+        return start_time, end_time
+
+    def trim_video(self, video_path, timestamp, duration=25, source=None, exact=False):
+        """
+        Extracts a segment of video centered around the key timestamp
+        Duration is split evenly before and after the timestamp
+        A MediaSource for the same file can be passed to reuse its probed duration
+        See trim_ranges for the meaning of exact
+        """
+        if source is not None:
+            video_duration = source.duration
+        else:
+            video_duration = float(ffmpeg.probe(video_path)['format']['duration'])
+        window = self.clip_window(timestamp, video_duration, duration)
+        output_path = clip_path(video_path, '_trimmed')
+        return self.trim_ranges(video_path, [window], exact=exact, output_paths=[output_path])[0][0]
+
+    def trim_ranges(self, video_path, ranges, exact=False, output_paths=None):
+        """
+        Cuts every (start, end) range out of the video and returns a
+        (clip_path, start, end) tuple per range, where start and end are the
+        times in the video that the clip actually covers
+
+        By default the clips are stream copied by a single ffmpeg process that
+        seeks to each range, with each range widened to the keyframes around it so no frame
+        is re-encoded. exact=True re-encodes each clip with moviepy instead,
+        for when frame-exact boundaries are required.
+        """
+        if output_paths is None:
+            output_paths = [clip_path(video_path, f'_trimmed_{i}') for i in range(len(ranges))]
+        if len(output_paths) != len(ranges):
+            raise ValueError("output_paths must have one entry per range")
+        if not ranges:
+            return []
+
+        if exact:
+            with get_telemetry().span("moviepy.reencode", clips=len(ranges)):
+                video = VideoFileClip(video_path)
+                for (start_time, end_time), output_path in zip(ranges, output_paths):
+                    video.subclip(start_time, end_time).write_videofile(output_path)
+                video.close()
+            return [(path, start, end) for path, (start, end) in zip(output_paths, ranges)]
+
+        keyframes = probe_keyframes(
+            video_path, min(start for start, _ in ranges), max(end for _, end in ranges)
+        )
+        outputs = []
+        clips = []
+        for (start_time, end_time), output_path in zip(ranges, output_paths):
+            start_time, end_time = self._pad_to_keyframes(keyframes, start_time, end_time)
+            clips.append((output_path, start_time, end_time))
+            # One seeking input per range, so ffmpeg jumps to each clip instead of
+            # reading every packet from the start of the file
+            outputs.append(
+                ffmpeg.input(video_path, ss=start_time, t=end_time - start_time).output(
+                    output_path,
+                    c='copy',
+                    avoid_negative_ts='make_zero',
+                )
+            )
+        with get_telemetry().span("ffmpeg.stream_copy", clips=len(ranges)):
+            ffmpeg.merge_outputs(*outputs).overwrite_output().run(capture_stdout=True, capture_stderr=True)
         
-        return output_path
+        return clips
+
+    @staticmethod
+    def _pad_to_keyframes(keyframes, start_time, end_time):
+        """Widens a range to the last keyframe at or before start and the first at or after end"""
+        index = bisect.bisect_right(keyframes, start_time) - 1
+        if index >= 0:
+            start_time = keyframes[index]
+        index = bisect.bisect_left(keyframes, end_time)
+        if index < len(keyframes):
+            end_time = keyframes[index]
+        return start_time, end_time
 
 from action_detector import ActionDetector
 
@@ -30,7 +115,9 @@ def trim_most_active_clip(video_path, duration=25, detector_api_key=None):
     Analyzes the video to find the most active and aggressive moment and trims the video around that moment.
     """
     detector = ActionDetector(api_key=detector_api_key) if detector_api_key else ActionDetector()
-    moments = detector.detect_key_moment(video_path)
+    moments = detector.top_moments(video_path, k=1)
+    if not moments:
+        raise ValueError(f"No key moment found in: {video_path}")
     best_timestamp = moments[0][0]  # highest scoring moment
     trimmer = VideoTrimmer()
     return trimmer.trim_video(video_path, best_timestamp, duration)
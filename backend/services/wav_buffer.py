@@ -0,0 +1,142 @@
+import struct
+from typing import NamedTuple
+
+
+class WavInfo(NamedTuple):
+    """Format and location of the PCM data inside a WAV buffer."""
+
+    sample_rate: int
+    channels: int
+    sample_width: int
+    data_offset: int
+    data_size: int
+
+    @property
+    def frame_size(self) -> int:
+        return self.channels * self.sample_width
+
+    @property
+    def duration(self) -> float:
+        return self.data_size / (self.frame_size * self.sample_rate)
+
+
+class WavChunk(NamedTuple):
+    """
+    A WAV file made of a fresh header and a zero-copy view of the parent PCM.
+
+    bytes(chunk) materializes the file only when it has to be uploaded.
+    """
+
+    header: bytes
+    pcm: memoryview
+    start: float
+    end: float
+
+    def __bytes__(self) -> bytes:
+        return self.header + self.pcm
+
+    def __len__(self) -> int:
+        return len(self.header) + self.pcm.nbytes
+
+
+def parse_wav(wav_bytes: bytes) -> WavInfo:
+    """
+    Reads the fmt and data chunks of a PCM WAV buffer without copying it.
+
+    WAV written to a pipe (as ffmpeg does) cannot have its sizes patched, so a
+    data size that is missing, 0xFFFFFFFF or past the end of the buffer is
+    taken to run to the end of the buffer.
+
+    Args:
+        wav_bytes: The WAV file contents.
+
+    Returns:
+        A WavInfo describing the PCM data.
+
+    Raises:
+        ValueError: If the buffer is not a PCM WAV file.
+    """
+    if len(wav_bytes) < 12 or wav_bytes[:4] != b"RIFF" or wav_bytes[8:12] != b"WAVE":
+        raise ValueError("Not a WAV file")
+
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(wav_bytes):
+        chunk_id = wav_bytes[offset:offset + 4]
+        (chunk_size,) = struct.unpack_from("<I", wav_bytes, offset + 4)
+        body = offset + 8
+
+        if chunk_id == b"fmt ":
+            _, channels, sample_rate, _, _, bits = struct.unpack_from("<HHIIHH", wav_bytes, body)
+            fmt = (sample_rate, channels, bits // 8)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("WAV data chunk found before fmt chunk")
+            available = len(wav_bytes) - body
+            if chunk_size == 0 or chunk_size > available:
+                chunk_size = available
+            frame_size = fmt[1] * fmt[2]
+            chunk_size -= chunk_size % frame_size
+            return WavInfo(*fmt, data_offset=body, data_size=chunk_size)
+
+        # Chunks are padded to an even number of bytes
+        offset = body + chunk_size + (chunk_size & 1)
+
+    raise ValueError("WAV file has no data chunk")
+
+
+def wav_header(data_size: int, sample_rate: int, channels: int, sample_width: int) -> bytes:
+    """Builds a canonical 44-byte PCM WAV header for data_size bytes of samples."""
+    byte_rate = sample_rate * channels * sample_width
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, byte_rate, channels * sample_width, sample_width * 8,
+        b"data", data_size,
+    )
+
+
+def iter_wav_chunks(wav_bytes: bytes, chunk_duration: float):
+    """
+    Splits a PCM WAV buffer into chunk_duration second WAV chunks.
+
+    Each chunk's PCM is a memoryview slice of wav_bytes; only the small header
+    is new.
+
+    Args:
+        wav_bytes: The WAV file contents.
+        chunk_duration: Length of each chunk in seconds.
+
+    Yields:
+        WavChunk objects in time order.
+    """
+    info = parse_wav(wav_bytes)
+    pcm = memoryview(wav_bytes)[info.data_offset:info.data_offset + info.data_size]
+    chunk_bytes = int(chunk_duration * info.sample_rate) * info.frame_size
+    bytes_per_second = info.sample_rate * info.frame_size
+
+    for start in range(0, len(pcm), chunk_bytes):
+        view = pcm[start:start + chunk_bytes]
+        header = wav_header(len(view), info.sample_rate, info.channels, info.sample_width)
+        yield WavChunk(
+            header, view, start / bytes_per_second, (start + len(view)) / bytes_per_second
+        )
+
+
+def wav_slice(wav_bytes: bytes, start: float, end: float, info: WavInfo | None = None) -> WavChunk:
+    """
+    Returns the [start, end) seconds of a PCM WAV buffer as a zero-copy WavChunk.
+
+    Args:
+        wav_bytes: The WAV file contents.
+        start: Start time in seconds.
+        end: End time in seconds.
+        info: The buffer's parsed header, to avoid parsing it again.
+    """
+    info = info or parse_wav(wav_bytes)
+    first = min(max(int(start * info.sample_rate), 0) * info.frame_size, info.data_size)
+    last = min(int(end * info.sample_rate) * info.frame_size, info.data_size)
+    view = memoryview(wav_bytes)[info.data_offset + first:info.data_offset + max(last, first)]
+    header = wav_header(len(view), info.sample_rate, info.channels, info.sample_width)
+    bytes_per_second = info.sample_rate * info.frame_size
+    return WavChunk(header, view, first / bytes_per_second, (first + len(view)) / bytes_per_second)
@@ -0,0 +1,66 @@
+import shutil
+
+import pytest
+
+pytest.importorskip("cv2")
+pytest.importorskip("ffmpeg")
+pytest.importorskip("google.cloud.vision")
+
+from action_detector import ActionDetector, plan_shards, select_top_moments
+from benchmark import FakeVisionClient, make_synthetic_video
+from media_source import MediaSource
+
+
+@pytest.fixture(scope="module")
+def clip(tmp_path_factory):
+    if shutil.which("ffmpeg") is None:
+        pytest.skip("ffmpeg binary not found")
+    # 20 s at 30 fps with a keyframe every 2 s, so there are several places to split
+    path = tmp_path_factory.mktemp("video") / "clip.mp4"
+    return str(make_synthetic_video(path, 20, 320, 180))
+
+
+def test_select_top_moments_suppresses_overlapping_windows():
+    moments = [(0, 3), (10, 9), (20, 4), (40, 6), (65, 5)]
+
+    assert select_top_moments(moments, 3, window=25) == [(10, 9), (40, 6), (65, 5)]
+
+
+def test_select_top_moments_keeps_windows_exactly_a_window_apart():
+    assert select_top_moments([(0, 5), (25, 4)], 2, window=25) == [(0, 5), (25, 4)]
+
+
+def test_select_top_moments_breaks_ties_by_earlier_moment():
+    assert select_top_moments([(70, 5), (40, 5), (10, 5)], 2) == [(10, 5), (40, 5)]
+    # Of two tied moments in one window the earlier survives
+    assert select_top_moments([(30, 5), (10, 5)], 2) == [(10, 5)]
+
+
+def test_select_top_moments_returns_fewer_than_k_when_suppressed():
+    assert select_top_moments([(10, 2), (12, 8), (14, 5)], 3) == [(12, 8)]
+    assert select_top_moments([], 3) == []
+
+
+def test_plan_shards_covers_every_sample_once():
+    frame_numbers = range(0, 3000, 150)
+    shards = plan_shards(frame_numbers, list(range(0, 3000, 60)), 4)
+
+    assert [n for group, _ in shards for n in group] == list(frame_numbers)
+    for (group, _), (_, previous) in zip(shards, shards[1:]):
+        assert previous == group[-1]
+
+
+@pytest.mark.parametrize("options", [{}, {"prefilter": True}], ids=["uniform", "prefilter"])
+def test_sharded_detection_matches_single_process(clip, options):
+    # Variable frame rate video falls back to one process, which would prove nothing
+    with MediaSource(clip) as source:
+        assert source.constant_frame_rate
+
+    single_client = FakeVisionClient(latency=0)
+    sharded_client = FakeVisionClient(latency=0)
+
+    single = ActionDetector(client=single_client).detect_key_moment(clip, **options)
+    sharded = ActionDetector(client=sharded_client).detect_key_moment(clip, workers=3, **options)
+
+    assert sharded == single
+    assert sharded_client.images == single_client.images
@@ -0,0 +1,180 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import artifact_store
+from artifact_store import ArtifactStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Only the store's clock is faked, so ages and access order are exact
+    now = [1000.0]
+    monkeypatch.setattr(artifact_store, "time", SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ArtifactStore(tmp_path / "artifacts")
+    yield store
+    store.close()
+
+
+def write(path, content):
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_hit_returns_the_saved_state(store, tmp_path):
+    clip = write(tmp_path / "clip.mp4", b"clip")
+
+    store.save("key", "trim", {"trimmed_video": clip}, [clip])
+
+    assert store.contains("key")
+    assert store.load("key") == {"trimmed_video": clip}
+    assert store.load("other") is None
+
+
+def test_missing_file_is_restored_on_a_hit(store, tmp_path):
+    (tmp_path / "clips").mkdir()
+    clip = write(tmp_path / "clips" / "clip.mp4", b"clip")
+    store.save("key", "trim", {"trimmed_video": clip}, [clip])
+    os.remove(clip)
+    os.rmdir(tmp_path / "clips")
+
+    assert store.load("key") == {"trimmed_video": clip}
+    assert open(clip, "rb").read() == b"clip"
+
+
+def test_overwritten_file_is_restored_on_a_hit(store, tmp_path):
+    clip = write(tmp_path / "clip.mp4", b"clip from this key")
+    store.save("key", "trim", {"trimmed_video": clip}, [clip])
+    # Another run with different parameters writes the same path
+    write(tmp_path / "clip.mp4", b"clip from another key")
+
+    store.load("key")
+
+    assert open(clip, "rb").read() == b"clip from this key"
+
+
+def test_only_the_given_files_are_stored(store, tmp_path):
+    clip = write(tmp_path / "clip.mp4", b"clip")
+    transcript = write(tmp_path / "clip.txt", b"words")
+
+    store.save("key", "transcribe", {"trimmed_video": clip, "transcript_path": transcript}, [transcript])
+
+    assert store.stats() == {"entries": 1, "bytes": len(b"words")}
+
+
+def test_artifact_without_its_files_is_a_miss(store, tmp_path):
+    clip = write(tmp_path / "clip.mp4", b"clip")
+    store.save("key", "trim", {"trimmed_video": clip}, [clip])
+    os.remove(clip)
+    for stored in (store.path / "key").iterdir():
+        stored.unlink()
+
+    assert store.load("key") is None
+    assert not store.contains("key")
+
+
+def test_expired_artifacts_are_ignored_and_collected(tmp_path, clock):
+    store = ArtifactStore(tmp_path / "artifacts", max_age=60)
+    clip = write(tmp_path / "clip.mp4", b"clip")
+    store.save("old", "trim", {"trimmed_video": clip}, [clip])
+    clock[0] += 30
+    store.save("new", "trim", {"trimmed_video": clip}, [clip])
+    clock[0] += 31
+
+    assert store.load("old") is None
+    assert store.gc() == 1
+    assert not (store.path / "old").exists()
+    assert store.contains("new")
+    store.close()
+
+
+def test_least_recently_used_artifacts_are_evicted_past_max_bytes(tmp_path, clock):
+    store = ArtifactStore(tmp_path / "artifacts", max_bytes=25)
+    for key in ("a", "b"):
+        clip = write(tmp_path / f"{key}.mp4", b"0123456789")
+        store.save(key, "trim", {"trimmed_video": clip}, [clip])
+        clock[0] += 1
+    store.load("a")
+    clock[0] += 1
+
+    clip = write(tmp_path / "c.mp4", b"0123456789")
+    store.save("c", "trim", {"trimmed_video": clip}, [clip])
+
+    assert [key for key in "abc" if store.contains(key)] == ["a", "c"]
+    assert not (store.path / "b").exists()
+    assert store.stats() == {"entries": 2, "bytes": 20}
+    store.close()
+
+
+@pytest.fixture
+def workflow(tmp_path, monkeypatch):
+    for module in ("cv2", "dotenv", "ffmpeg", "google.cloud.vision", "moviepy", "openai", "torch", "tqdm", "transformers"):
+        pytest.importorskip(module)
+    import main
+
+    monkeypatch.setenv("ARTIFACT_STORE_PATH", str(tmp_path / "artifacts"))
+    monkeypatch.delenv("ARTIFACT_STORE", raising=False)
+    workflow = main.BodycamAnalysisWorkflow(openai_client=object(), vision_client=object())
+    workflow.calls = []
+
+    def stage(name, update):
+        def run(video_path, state, source):
+            workflow.calls.append(name)
+            return update(state)
+        monkeypatch.setattr(workflow, f"_stage_{name}", run)
+
+    clip_path = str(tmp_path / "video_trimmed_0.mp4")
+
+    def trim(state):
+        write(tmp_path / "video_trimmed_0.mp4", b"clip")
+        return {"clips": [{**state["clips"][0], "trimmed_video": clip_path}]}
+
+    stage("detect", lambda state: {"key_timestamp": 5.0, "clips": [{"timestamp": 5.0, "start": 0, "end": 10}]})
+    stage("trim", trim)
+    stage("transcribe", lambda state: {"clips": [{**state["clips"][0], "transcript": "words"}]})
+    stage("frames", lambda state: {"clips": [{**state["clips"][0], "frame_data": []}]})
+    stage("analyze", lambda state: {"clips": [{**state["clips"][0], "analysis": "calm"}]})
+    return workflow
+
+
+def run_stages(workflow, video_path):
+    state = {}
+    for stage in workflow.STAGES:
+        # The stubbed stages never read the source, so no MediaSource is opened
+        state.update(workflow.run_stage(stage, video_path, state, source=object()))
+    return state
+
+
+def test_changed_prompt_reruns_only_analyze(workflow, tmp_path, monkeypatch):
+    import main
+
+    video = write(tmp_path / "video.mp4", b"video")
+    first = run_stages(workflow, video)
+    assert workflow.calls == list(workflow.STAGES)
+
+    workflow.calls.clear()
+    assert run_stages(workflow, video) == first
+    assert workflow.calls == []
+
+    monkeypatch.setattr(main, "SUMMARY_PROMPT", main.SUMMARY_PROMPT + " Be brief.")
+    run_stages(workflow, video)
+    assert workflow.calls == ["analyze"]
+
+
+def test_deleted_clip_is_restored_when_trim_is_skipped(workflow, tmp_path):
+    video = write(tmp_path / "video.mp4", b"video")
+    state = run_stages(workflow, video)
+    clip = state["clips"][0]["trimmed_video"]
+    os.remove(clip)
+
+    workflow.calls.clear()
+    run_stages(workflow, video)
+
+    assert workflow.calls == []
+    assert open(clip, "rb").read() == b"clip"
@@ -0,0 +1,81 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+for module in ("cv2", "dotenv", "ffmpeg", "google.cloud.vision", "moviepy", "openai", "torch", "tqdm", "transformers"):
+    pytest.importorskip(module)
+
+import batch_runner
+from batch_runner import BatchRunner, JobStore
+
+
+class StubWorkflow:
+    """Records the stages it runs and the state each one was given."""
+
+    def __init__(self, fail_at=None):
+        self.fail_at = fail_at
+        self.calls = []
+
+    def run_stage(self, stage, video_path, state, source=None):
+        self.calls.append((stage, dict(state)))
+        if stage == self.fail_at:
+            raise RuntimeError("interrupted")
+        update = {stage: "done"}
+        if stage == "detect":
+            update["key_timestamp"] = 5.0
+        return update
+
+
+def run_job(store, workflow, video_path, monkeypatch):
+    # CPU stages run on a thread with the stub standing in for the worker's workflow
+    monkeypatch.setattr(batch_runner, "_worker_workflow", workflow)
+    runner = BatchRunner(store, cpu_workers=1, api_workers=1)
+    runner.workflow = workflow
+
+    async def run():
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            await runner._run_job(video_path, pool, asyncio.Semaphore(1))
+
+    asyncio.run(run())
+
+
+def test_job_resumes_from_its_last_completed_stage(tmp_path, monkeypatch):
+    db = str(tmp_path / "jobs.sqlite3")
+    video = str(tmp_path / "video.mp4")
+    store = JobStore(db)
+    store.add(video)
+
+    interrupted = StubWorkflow(fail_at="frames")
+    run_job(store, interrupted, video, monkeypatch)
+
+    assert [stage for stage, _ in interrupted.calls] == ["detect", "trim", "transcribe", "frames"]
+    assert store.summary() == {"failed": 1}
+
+    # A new runner on the same job table picks the job up where it stopped
+    store = JobStore(db)
+    assert store.unfinished() == [video]
+    resumed = StubWorkflow()
+    run_job(store, resumed, video, monkeypatch)
+
+    assert [stage for stage, _ in resumed.calls] == ["frames", "analyze"]
+    assert resumed.calls[0][1] == {
+        "detect": "done", "key_timestamp": 5.0, "trim": "done", "transcribe": "done",
+    }
+    assert store.summary() == {"done": 1}
+    assert store.unfinished() == []
+
+
+def test_job_without_a_key_moment_finishes_after_detect(tmp_path, monkeypatch):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    video = str(tmp_path / "video.mp4")
+    store.add(video)
+    workflow = StubWorkflow()
+    workflow.run_stage = lambda stage, video_path, state, source=None: (
+        workflow.calls.append((stage, state)) or {"key_timestamp": None}
+    )
+
+    run_job(store, workflow, video, monkeypatch)
+
+    assert [stage for stage, _ in workflow.calls] == ["detect"]
+    assert store.summary() == {"done": 1}
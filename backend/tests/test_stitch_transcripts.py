@@ -0,0 +1,53 @@
+import pytest
+
+for module in ("cv2", "ffmpeg", "numpy", "openai", "tqdm"):
+    pytest.importorskip(module)
+
+from subtitle_generator import stitch_transcripts
+
+
+def test_overlap_is_removed():
+    stitched = stitch_transcripts([
+        "the officer asked him to step out of",
+        "step out of the car now please",
+    ])
+
+    assert stitched == "the officer asked him to step out of the car now please"
+
+
+def test_word_cut_at_the_boundary_is_kept_from_the_side_that_heard_it_whole():
+    stitched = stitch_transcripts([
+        "he told him to step out of the c",
+        "out of the car please",
+    ])
+
+    assert stitched == "he told him to step out of the car please"
+
+
+def test_overlap_ignores_case_and_punctuation():
+    stitched = stitch_transcripts(["Sir, stop right there.", "stop right there hands up"])
+
+    assert stitched == "Sir, stop right there hands up"
+
+
+def test_phrase_repeated_away_from_the_boundary_is_kept():
+    first = "show me your hands show me your hands right now officer"
+    second = "he said show me your hands again"
+
+    assert stitch_transcripts([first, second]) == f"{first} {second}"
+
+
+def test_short_match_is_not_treated_as_overlap():
+    assert stitch_transcripts(["we are here", "are here today"]) == "we are here are here today"
+
+
+def test_overlap_longer_than_the_search_window_is_not_removed():
+    first = "one two three four five"
+    second = "one two three four five six"
+
+    assert stitch_transcripts([first, second], max_overlap_words=2) == f"{first} {second}"
+
+
+def test_chunks_without_overlap_are_joined():
+    assert stitch_transcripts(["hello there", "", "general kenobi"]) == "hello there general kenobi"
+    assert stitch_transcripts([]) == ""
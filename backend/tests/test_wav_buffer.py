@@ -0,0 +1,94 @@
+import struct
+
+import pytest
+
+from wav_buffer import iter_wav_chunks, parse_wav, wav_header, wav_slice
+
+RATE = 16000
+
+
+def make_wav(seconds, channels=1, data_size=None, extra=b""):
+    # 16-bit PCM whose bytes count up, so every slice can be checked by content
+    pcm = bytes(i % 256 for i in range(int(seconds * RATE) * channels * 2))
+    header = bytearray(wav_header(len(pcm), RATE, channels, 2))
+    if data_size is not None:
+        struct.pack_into("<I", header, 40, data_size)
+    # Extra chunks go between the fmt and data chunks
+    return bytes(header[:36]) + extra + bytes(header[36:]) + pcm, pcm
+
+
+def test_parse_wav_reads_format_and_data():
+    wav, pcm = make_wav(1.5, channels=2)
+
+    info = parse_wav(wav)
+
+    assert (info.sample_rate, info.channels, info.sample_width) == (RATE, 2, 2)
+    assert wav[info.data_offset:info.data_offset + info.data_size] == pcm
+    assert info.duration == 1.5
+
+
+@pytest.mark.parametrize("data_size", [0, 0xFFFFFFFF], ids=["zero", "max"])
+def test_parse_wav_streamed_size_runs_to_end(data_size):
+    wav, pcm = make_wav(1, data_size=data_size)
+
+    info = parse_wav(wav)
+
+    assert info.data_size == len(pcm)
+
+
+def test_parse_wav_drops_partial_trailing_frame():
+    wav, pcm = make_wav(1, channels=2, data_size=0)
+
+    info = parse_wav(wav + b"\x01")
+
+    assert info.data_size == len(pcm)
+
+
+def test_parse_wav_skips_padded_chunks():
+    # An odd-sized chunk is followed by a pad byte
+    wav, pcm = make_wav(1, extra=b"LIST" + struct.pack("<I", 3) + b"abc\x00")
+
+    info = parse_wav(wav)
+
+    assert wav[info.data_offset:info.data_offset + info.data_size] == pcm
+
+
+@pytest.mark.parametrize("wav", [b"", b"RIFF\x00\x00\x00\x00AVI ", wav_header(0, RATE, 1, 2)[:36]])
+def test_parse_wav_rejects_invalid_buffers(wav):
+    with pytest.raises(ValueError):
+        parse_wav(wav)
+
+
+def test_iter_wav_chunks_covers_pcm_without_gaps():
+    wav, pcm = make_wav(2.5)
+
+    chunks = list(iter_wav_chunks(wav, 1))
+
+    assert [(chunk.start, chunk.end) for chunk in chunks] == [(0, 1), (1, 2), (2, 2.5)]
+    assert b"".join(chunk.pcm for chunk in chunks) == pcm
+    for chunk in chunks:
+        info = parse_wav(bytes(chunk))
+        assert info.data_size == chunk.pcm.nbytes == len(chunk) - 44
+
+
+def test_wav_slice_returns_requested_seconds():
+    wav, pcm = make_wav(3)
+
+    chunk = wav_slice(wav, 1, 2)
+
+    assert (chunk.start, chunk.end) == (1, 2)
+    assert bytes(chunk.pcm) == pcm[RATE * 2:RATE * 4]
+
+
+@pytest.mark.parametrize(
+    "start, end, expected",
+    [(-1, 1, (0, 1)), (2, 10, (2, 3)), (2, 1, (2, 2)), (5, 6, (3, 3))],
+    ids=["before-start", "past-end", "reversed", "outside"],
+)
+def test_wav_slice_clamps_to_the_data(start, end, expected):
+    wav, _ = make_wav(3)
+
+    chunk = wav_slice(wav, start, end)
+
+    assert (chunk.start, chunk.end) == expected
+    assert parse_wav(bytes(chunk)).data_size == chunk.pcm.nbytes
@@ -7,8 +7,18 @@ interface Item {
   name: string;
 }
 
+interface AnalysisJob {
+  id: string;
+  status: string;
+  created: number;
+  result: { analysis: string } | null;
+}
+
+const ANALYSIS_API_URL = process.env.NEXT_PUBLIC_ANALYSIS_API_URL || 'http://127.0.0.1:8000';
+
 const FetchData: React.FC = () => {
   const [data, setData] = useState<Item[]>([]);
+  const [analysis, setAnalysis] = useState<string | null>(null);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
@@ -19,7 +29,21 @@ const FetchData: React.FC = () => {
       setLoading(false);
     };
 
+    const fetchAnalysis = async () => {
+      try {
+        const response = await fetch(`${ANALYSIS_API_URL}/jobs`);
+        const jobs: AnalysisJob[] = await response.json();
+        const latest = jobs
+          .filter((job) => job.status === 'done' && job.result)
+          .sort((a, b) => b.created - a.created)[0];
+        if (latest?.result) setAnalysis(latest.result.analysis);
+      } catch (error) {
+        console.error('Error fetching analysis:', error);
+      }
+    };
+
     fetchData();
+    fetchAnalysis();
   }, []);
 
   if (loading) return <p>Loading...</p>;
@@ -29,7 +53,7 @@ const FetchData: React.FC = () => {
       <h2>Footage Analysis:
       </h2>
       <ul>
-     <p>The officer engaged in a routine stop that escalated when the suspect resisted verbal commands. The officer responded with force exceeding necessary levels, continuing to apply physical pressure after the suspect was restrained, which constitutes excessive use of force.</p>
+     <p>{analysis ?? 'The officer engaged in a routine stop that escalated when the suspect resisted verbal commands. The officer responded with force exceeding necessary levels, continuing to apply physical pressure after the suspect was restrained, which constitutes excessive use of force.'}</p>
       </ul>
     </div>
   );